@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_modified_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS content.outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    entity TEXT NOT NULL,
+                    entity_id UUID NOT NULL,
+                    operation TEXT NOT NULL,
+                    created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+                );
+
+                CREATE OR REPLACE FUNCTION content.outbox_record() RETURNS trigger AS $$
+                DECLARE
+                    changed RECORD;
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        changed := OLD;
+                    ELSE
+                        changed := NEW;
+                    END IF;
+
+                    -- Outbox ids have to follow commit order, otherwise the ETL could move its
+                    -- checkpoint past an id of a transaction that is not committed yet.
+                    PERFORM pg_advisory_xact_lock(hashtext('content.outbox'));
+
+                    IF TG_TABLE_NAME IN ('genre_film_work', 'person_film_work') THEN
+                        INSERT INTO content.outbox (entity, entity_id, operation)
+                        VALUES ('film_work', changed.film_work_id, TG_OP);
+                    ELSE
+                        INSERT INTO content.outbox (entity, entity_id, operation)
+                        VALUES (TG_TABLE_NAME, changed.id, TG_OP);
+                    END IF;
+
+                    PERFORM pg_notify('content_outbox', TG_TABLE_NAME);
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER film_work_outbox AFTER INSERT OR UPDATE OR DELETE ON content.film_work
+                    FOR EACH ROW EXECUTE FUNCTION content.outbox_record();
+                CREATE TRIGGER genre_outbox AFTER INSERT OR UPDATE OR DELETE ON content.genre
+                    FOR EACH ROW EXECUTE FUNCTION content.outbox_record();
+                CREATE TRIGGER person_outbox AFTER INSERT OR UPDATE OR DELETE ON content.person
+                    FOR EACH ROW EXECUTE FUNCTION content.outbox_record();
+                CREATE TRIGGER genre_film_work_outbox AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+                    FOR EACH ROW EXECUTE FUNCTION content.outbox_record();
+                CREATE TRIGGER person_film_work_outbox AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+                    FOR EACH ROW EXECUTE FUNCTION content.outbox_record();
+
+                INSERT INTO content.outbox (entity, entity_id, operation)
+                SELECT 'film_work', id, 'INSERT' FROM content.film_work
+                UNION ALL
+                SELECT 'genre', id, 'INSERT' FROM content.genre
+                UNION ALL
+                SELECT 'person', id, 'INSERT' FROM content.person;
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS film_work_outbox ON content.film_work;
+                DROP TRIGGER IF EXISTS genre_outbox ON content.genre;
+                DROP TRIGGER IF EXISTS person_outbox ON content.person;
+                DROP TRIGGER IF EXISTS genre_film_work_outbox ON content.genre_film_work;
+                DROP TRIGGER IF EXISTS person_film_work_outbox ON content.person_film_work;
+                DROP FUNCTION IF EXISTS content.outbox_record();
+                DROP TABLE IF EXISTS content.outbox;
+            """,
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+OUTBOX_RECORD = """
+    CREATE OR REPLACE FUNCTION content.outbox_record() RETURNS trigger AS $$
+    DECLARE
+        changed RECORD;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD;
+        ELSE
+            changed := NEW;
+        END IF;
+
+        -- Outbox ids have to follow commit order, otherwise the ETL could move its
+        -- checkpoint past an id of a transaction that is not committed yet.
+        PERFORM pg_advisory_xact_lock(hashtext('content.outbox'));
+
+        IF TG_TABLE_NAME IN ('genre_film_work', 'person_film_work') THEN
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES ('film_work', changed.film_work_id, TG_OP);
+        ELSE
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES (TG_TABLE_NAME, changed.id, TG_OP);
+        END IF;
+        {person_films}
+        PERFORM pg_notify('content_outbox', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# the filmography of a person is a part of the persons document
+PERSON_FILMS = """
+        IF TG_TABLE_NAME = 'person_film_work' THEN
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES ('person_films', changed.person_id, TG_OP);
+        END IF;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_outbox'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=OUTBOX_RECORD.replace('{person_films}', PERSON_FILMS),
+            reverse_sql=OUTBOX_RECORD.replace('{person_films}', ''),
+        ),
+    ]
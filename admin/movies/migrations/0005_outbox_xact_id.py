@@ -0,0 +1,59 @@
+from importlib import import_module
+
+from django.db import migrations
+
+previous = import_module('movies.migrations.0004_outbox_person_films')
+
+# Every outbox row keeps the id of the transaction that wrote it. The ETL reads rows in
+# (xact_id, id) order and only those of transactions older than the snapshot xmin, all of
+# which are finished, so its checkpoint never passes a row that is not committed yet.
+# That replaces the advisory lock that serialized all writes to the content tables.
+OUTBOX_RECORD = """
+    CREATE OR REPLACE FUNCTION content.outbox_record() RETURNS trigger AS $$
+    DECLARE
+        changed RECORD;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD;
+        ELSE
+            changed := NEW;
+        END IF;
+
+        IF TG_TABLE_NAME IN ('genre_film_work', 'person_film_work') THEN
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES ('film_work', changed.film_work_id, TG_OP);
+        ELSE
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES (TG_TABLE_NAME, changed.id, TG_OP);
+        END IF;
+
+        IF TG_TABLE_NAME = 'person_film_work' THEN
+            INSERT INTO content.outbox (entity, entity_id, operation)
+            VALUES ('person_films', changed.person_id, TG_OP);
+        END IF;
+
+        PERFORM pg_notify('content_outbox', TG_TABLE_NAME);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_outbox_person_films'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE content.outbox ADD COLUMN IF NOT EXISTS xact_id XID8 NOT NULL DEFAULT pg_current_xact_id();
+                CREATE INDEX IF NOT EXISTS outbox_xact_id_id_idx ON content.outbox (xact_id, id);
+            """ + OUTBOX_RECORD,
+            reverse_sql=previous.OUTBOX_RECORD.replace('{person_films}', previous.PERSON_FILMS) + """
+                DROP INDEX IF EXISTS content.outbox_xact_id_id_idx;
+                ALTER TABLE content.outbox DROP COLUMN IF EXISTS xact_id;
+            """,
+        ),
+    ]
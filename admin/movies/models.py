@@ -31,6 +31,7 @@ class Genre(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"genre"
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
+        indexes = [models.Index(fields=['modified', 'id'], name='genre_modified_id_idx')]
 
 class Person(UUIDMixin, TimeStampedMixin):
     full_name = models.CharField(verbose_name=_('full name'), max_length=255, null=True)
@@ -42,6 +43,7 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"person"
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [models.Index(fields=['modified', 'id'], name='person_modified_id_idx')]
 
 
 class Filmwork(UUIDMixin, TimeStampedMixin):
@@ -70,6 +72,7 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"film_work"
         verbose_name = _('Filmwork')
         verbose_name_plural = _('Filmworks')
+        indexes = [models.Index(fields=['modified', 'id'], name='film_work_modified_id_idx')]
 
 
 class GenreFilmwork(UUIDMixin):
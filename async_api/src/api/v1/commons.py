@@ -21,3 +21,15 @@ async def page_data(
     ] = 0,
 ):
     return {'page_size': page_size, 'page_number': page_number}
+
+
+async def page_cursor(
+    cursor: Annotated[
+        str | None, Query(
+            title='Pagination cursor',
+            description='Курсор пагинации: * для первой страницы, дальше значение заголовка X-Next-Cursor',
+            min_length=1,
+        ),
+    ] = None,
+):
+    return cursor
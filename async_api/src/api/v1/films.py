@@ -2,10 +2,11 @@ from http import HTTPStatus
 from typing import Annotated
 from uuid import UUID
 
-from api.v1.commons import page_data
-from fastapi import APIRouter, Depends, HTTPException, Query
+from api.v1.commons import page_cursor, page_data
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from models.film import FullFilm, ShortFilm
 from services.film_service import FilmService, SortModel, get_film_service
+from services.pagination import NEXT_CURSOR_HEADER, CursorError
 from services.validation import check_roles
 
 router = APIRouter()
@@ -13,7 +14,9 @@ router = APIRouter()
 
 @router.get('/', response_model=list[ShortFilm], description='Список всех фильмов', tags=['films'])
 async def get_all_films(
+    response: Response,
     page_data: Annotated[dict, Depends(page_data)],
+    cursor: Annotated[str | None, Depends(page_cursor)],
     genre: Annotated[
         str | None, Query(
             min_length=1,
@@ -32,7 +35,15 @@ async def get_all_films(
     if not check_roles:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='no role found')
 
-    films = await film_service.get_all(page_data['page_size'], page_data['page_number'], genre, sort)
+    if cursor:
+        try:
+            films, next_cursor = await film_service.get_page(page_data['page_size'], cursor, genre, sort)
+        except CursorError as error:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(error))
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        films = await film_service.get_all(page_data['page_size'], page_data['page_number'], genre, sort)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
 
@@ -2,10 +2,11 @@ from http import HTTPStatus
 from typing import Annotated
 from uuid import UUID
 
-from api.v1.commons import page_data
-from fastapi import APIRouter, Depends, HTTPException
+from api.v1.commons import page_cursor, page_data
+from fastapi import APIRouter, Depends, HTTPException, Response
 from models.genre import Genre
 from services.genre_service import GenreService, get_genre_service
+from services.pagination import NEXT_CURSOR_HEADER, CursorError
 from services.validation import check_roles
 
 router = APIRouter()
@@ -19,13 +20,23 @@ router = APIRouter()
     tags=['genres'],
 )
 async def genre_list(
+        response: Response,
         page_data: Annotated[dict, Depends(page_data)],
+        cursor: Annotated[str | None, Depends(page_cursor)],
         genre_service: GenreService = Depends(get_genre_service),
         check_roles: bool = Depends(check_roles),
 ) -> list[Genre]:
     if not check_roles:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='no role found')
-    genres = await genre_service.get_all(page_data['page_size'], page_data['page_number'])
+    if cursor:
+        try:
+            genres, next_cursor = await genre_service.get_page(page_data['page_size'], cursor)
+        except CursorError as error:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(error))
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        genres = await genre_service.get_all(page_data['page_size'], page_data['page_number'])
     if not genres:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='not found genres')
     return [Genre(id=genre.id, name=genre.name, description=genre.description) for genre in genres]
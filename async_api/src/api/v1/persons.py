@@ -2,10 +2,11 @@ from http import HTTPStatus
 from typing import Annotated
 from uuid import UUID
 
-from api.v1.commons import page_data
-from fastapi import APIRouter, Depends, HTTPException, Query
+from api.v1.commons import page_cursor, page_data
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from models.film import ShortFilm
 from models.person import Person, PersonFilmsRoles
+from services.pagination import NEXT_CURSOR_HEADER, CursorError
 from services.person_service import PersonService, get_person_service
 from services.validation import check_roles
 
@@ -19,13 +20,23 @@ router = APIRouter()
     response_model=list[Person],
 )
 async def person_all(
+        response: Response,
         page_data: Annotated[dict, Depends(page_data)],
+        cursor: Annotated[str | None, Depends(page_cursor)],
         person_service: PersonService = Depends(get_person_service),
         check_roles: bool = Depends(check_roles),
 ) -> list[Person]:
     if not check_roles:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='no role found')
-    persons = await person_service.get_all(page_data['page_size'], page_data['page_number'])
+    if cursor:
+        try:
+            persons, next_cursor = await person_service.get_page(page_data['page_size'], cursor)
+        except CursorError as error:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(error))
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        persons = await person_service.get_all(page_data['page_size'], page_data['page_number'])
     if not persons:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='not found persons')
     return [Person(id=person.id, name=person.name) for person in persons]
@@ -15,8 +15,17 @@ class Settings(BaseSettings):
     redis_host: str = Field('127.0.0.1', alias='API_REDIS_HOST')
     redis_port: int = Field(6379, alias='API_REDIS_PORT')
 
+    cache_expire: int = Field(60 * 5, alias='CACHE_EXPIRE_IN_SECONDS')
+    cache_list_expire: int = Field(60 * 5, alias='CACHE_LIST_EXPIRE_IN_SECONDS')
+    cache_local_size: int = Field(1000, alias='CACHE_LOCAL_SIZE')
+    cache_local_ttl: float = Field(30, alias='CACHE_LOCAL_TTL')
+    cache_stats_interval: float = Field(60, alias='CACHE_STATS_INTERVAL')
+    cache_fetch_time: float = Field(0.1, alias='CACHE_FETCH_TIME')
+    cache_early_refresh_beta: float = Field(1.0, alias='CACHE_EARLY_REFRESH_BETA')
+
     elastic_host: str = Field('127.0.0.1', alias='ELASTIC_HOST')
     elastic_port: int = Field(9200, alias='ELASTIC_PORT')
+    elastic_pit_keep_alive: str = Field('1m', alias='ELASTIC_PIT_KEEP_ALIVE')
 
     token_secret_key: str = Field('secret', alias='TOKEN_SECRET_KEY')
 
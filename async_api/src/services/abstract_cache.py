@@ -7,13 +7,21 @@ class AbstractCache(ABC):
         pass
 
     @abstractmethod
-    async def put_one(self, cache_id: str, entity: object) -> None:
+    async def put_one(self, cache_id: str, entity: object, generation: bytes | None) -> None:
         pass
 
     @abstractmethod
-    async def get_many(self, model, cache_id: str) -> list[object]:
+    async def get_many(self, cache_id: str) -> list[str]:
         pass
 
     @abstractmethod
-    async def put_many(self, cache_id: str, items: list[object]) -> None:
+    async def put_many(self, cache_id: str, ids: list[str], generation: bytes | None) -> None:
+        pass
+
+    @abstractmethod
+    async def fetch_one(self, cache_id: str, entity: object, fetch) -> object:
+        pass
+
+    @abstractmethod
+    async def fetch_many(self, model, cache_id: str, fetch_ids, fetch) -> list[object]:
         pass
@@ -1,40 +1,353 @@
+import asyncio
 import logging
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial
 
+import backoff
+import msgpack
+import orjson
+from core.config import settings
 from models.film import Film
 from models.genre import Genre
 from models.person import Person
+from pydantic import BaseModel
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import WatchError
 from services.abstract_cache import AbstractCache
 
-DELIMETER = '<delimiter>'
-CACHE_EXPIRE_IN_SECONDS = 60 * 5
+CACHE_EXPIRE_IN_SECONDS = settings.cache_expire
+LIST_EXPIRE_IN_SECONDS = settings.cache_list_expire
+# a tag outlives every entry it lists
+TAG_EXPIRE_IN_SECONDS = max(CACHE_EXPIRE_IN_SECONDS, LIST_EXPIRE_IN_SECONDS)
+INVALIDATION_CHANNEL = 'cache:invalidate'
+TAG_PREFIX = 'cache:tag'
+GENERATION_PREFIX = 'cache:generation'
+
+# tells the messages of this worker from the messages of the other uvicorn workers
+WORKER_ID = uuid.uuid4().hex
+
+
+class LocalCache:
+    # In-process LRU of parsed models with a TTL, shared by the services of one worker.
+    # Every entry keeps the time its Redis copy expires at. size=0 turns it off.
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+
+    def get(self, key: str) -> tuple | None:
+        item = self.items.get(key)
+        if item is None:
+            return None
+        value, expires, deadline = item
+        if expires < time.monotonic():
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return value, deadline
+
+    def put(self, key: str, value, deadline: float) -> None:
+        if not self.size:
+            return
+        self.items[key] = (value, min(time.monotonic() + self.ttl, deadline), deadline)
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.items.pop(key, None)
+
+    def clear(self) -> None:
+        self.items.clear()
+
+
+class CacheStats:
+    TIERS = ('local', 'redis')
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reported = time.monotonic()
+        self.hits = dict.fromkeys(self.TIERS, 0)
+        self.misses = dict.fromkeys(self.TIERS, 0)
+
+    def hit(self, tier: str) -> None:
+        self.hits[tier] += 1
+        self.report()
+
+    def miss(self, tier: str) -> None:
+        self.misses[tier] += 1
+        self.report()
+
+    def ratios(self) -> dict:
+        return {tier: self.hits[tier] / max(self.hits[tier] + self.misses[tier], 1) for tier in self.TIERS}
+
+    def report(self) -> None:
+        if time.monotonic() - self.reported < self.interval:
+            return
+        self.reported = time.monotonic()
+        logging.info(
+            'CACHE hit ratio: ' + ', '.join(
+                f'{tier} {ratio:.1%} of {self.hits[tier] + self.misses[tier]}' for tier, ratio in self.ratios().items()
+            ),
+        )
+
+
+def pack_entity(entity) -> bytes:
+    return msgpack.packb(entity.model_dump(mode='json'))
+
+
+def unpack_entity(model, data: bytes):
+    return model.model_validate(msgpack.unpackb(data))
+
+
+def pack_ids(ids: list[str]) -> bytes:
+    # ids are kept as 16 raw bytes each
+    return msgpack.packb([uuid.UUID(str(item)).bytes for item in ids])
+
+
+def unpack_ids(data: bytes) -> list[str]:
+    return [str(uuid.UUID(bytes=item)) for item in msgpack.unpackb(data)]
+
+
+def entity_ids(value) -> set[str]:
+    # ids of the entity and of every entity nested in it
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    ids = set()
+    if isinstance(value, dict):
+        if value.get('id') is not None:
+            ids.add(str(value['id']))
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list, BaseModel)):
+                ids |= entity_ids(item)
+    return ids
+
+
+local_cache = LocalCache(settings.cache_local_size, settings.cache_local_ttl)
+stats = CacheStats(settings.cache_stats_interval)
+
+
+@backoff.on_exception(
+    backoff.expo,
+    (RedisConnectionError,),
+    jitter=backoff.random_jitter,
+    on_backoff=lambda details: local_cache.clear(),
+)
+async def listen(redis) -> None:
+    # Drops the keys other workers changed from the local cache. Messages sent while
+    # the connection was down are lost, so the whole local cache is dropped on reconnect.
+    async with redis.pubsub() as pubsub:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        async for message in pubsub.listen():
+            if message['type'] != 'message':
+                continue
+            data = orjson.loads(message['data'])
+            if data['origin'] != WORKER_ID:
+                local_cache.delete(*data['keys'])
 
 
 class Cache(AbstractCache):
-    def __init__(self, redis):
+    # Concurrent misses of one key share one fetch from the storage (single flight), and a key
+    # is refreshed in the background a little before it expires, with a probability that grows
+    # as the expiry gets closer and as the fetch gets slower (probabilistic early expiration).
+    #
+    # Every entity is cached once under its own key, lists and search pages only keep the
+    # ordered ids and are hydrated from the entity keys with one MGET. Values are msgpack.
+    #
+    # Every entry is tagged with the ids of the entities it contains, lists also with the index
+    # name. The ETL deletes the entries of the tags it changes, publishes the keys it deleted and
+    # bumps the generation of the index. Lists expire sooner than entities.
+    #
+    # The generation is read before every fetch from the storage and the result is only cached if
+    # it did not change meanwhile, otherwise a fetch that started before a change could put the old
+    # data back after the ETL evicted it.
+    def __init__(self, redis, index: str, local: LocalCache = local_cache):
         self.cache = redis
+        self.index = index
+        self.generation_key = f'{GENERATION_PREFIX}:{index}'
+        self.local = local
+        self.fetch_time = settings.cache_fetch_time
+        self.flights = {}
+
+    def entity_key(self, entity_id) -> str:
+        return '_'.join([self.index, 'get_by_id', str(entity_id)])
+
+    async def _publish(self, keys: list[str]) -> None:
+        if self.local.size:
+            await self.cache.publish(INVALIDATION_CHANNEL, orjson.dumps({'origin': WORKER_ID, 'keys': keys}))
+
+    async def _get(self, cache_id: str, parse) -> tuple:
+        item = self.local.get(cache_id)
+        if item is not None:
+            stats.hit('local')
+            return item
+        stats.miss('local')
+        async with self.cache.pipeline(transaction=False) as pipe:
+            data, ttl = await pipe.get(cache_id).pttl(cache_id).execute()
+        if not data:
+            stats.miss('redis')
+            return None, None
+        stats.hit('redis')
+        item = parse(data)
+        deadline = time.monotonic() + max(ttl, 0) / 1000
+        self.local.put(cache_id, item, deadline)
+        return item, deadline
+
+    async def generation(self) -> bytes | None:
+        return await self.cache.get(self.generation_key)
+
+    async def _put(self, entries: list[tuple], generation: bytes | None) -> bool:
+        # entries are (cache_id, item, data, tags, expire), all written in one transaction
+        # and only if the generation is still the one read before the fetch
+        async with self.cache.pipeline(transaction=True) as pipe:
+            await pipe.watch(self.generation_key)
+            if await pipe.get(self.generation_key) != generation:
+                logging.info(f'MAKE: {self.index} changed during the fetch, {len(entries)} entries are not cached')
+                return False
+            pipe.multi()
+            for cache_id, _, data, tags, expire in entries:
+                pipe.set(cache_id, data, expire)
+                for tag in tags:
+                    pipe.sadd(f'{TAG_PREFIX}:{tag}', cache_id).expire(f'{TAG_PREFIX}:{tag}', TAG_EXPIRE_IN_SECONDS)
+            try:
+                await pipe.execute()
+            except WatchError:
+                return False
+        now = time.monotonic()
+        for cache_id, item, _, _, expire in entries:
+            self.local.put(cache_id, item, now + expire)
+        await self._publish([entry[0] for entry in entries])
+        return True
+
+    def _expires_early(self, deadline: float) -> bool:
+        gap = -self.fetch_time * settings.cache_early_refresh_beta * math.log(1.0 - random.random())
+        return time.monotonic() + gap >= deadline
+
+    async def _load(self, cache_id: str, fetch, put):
+        generation = await self.generation()
+        t1 = time.monotonic()
+        result = await fetch()
+        self.fetch_time = 0.8 * self.fetch_time + 0.2 * (time.monotonic() - t1)
+        if result:
+            await put(cache_id, result, generation)
+        return result
+
+    def _flight(self, key: str, load) -> asyncio.Task:
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.create_task(load())
+            self.flights[key] = task
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+        return task
+
+    async def _fetch(self, cache_id: str, parse, fetch, put):
+        item, deadline = await self._get(cache_id, parse)
+        load = partial(self._load, cache_id, fetch, put)
+        if item is not None:
+            if cache_id not in self.flights and self._expires_early(deadline):
+                logging.info(f'MAKE: early refresh of {cache_id}')
+                self._flight(cache_id, load).add_done_callback(_log_failure)
+            return item
+        # a caller that is cancelled does not cancel the fetch the other callers wait for
+        return await asyncio.shield(self._flight(cache_id, load))
 
     async def get_one(self, cache_id: str, entity: Person | Genre | Film):
         logging.info('MAKE: get_one_from_cache')
-        data = await self.cache.get(cache_id)
-        if not data:
-            return None
-        res = entity.parse_raw(data)
-        return res
+        item, _ = await self._get(cache_id, partial(unpack_entity, entity))
+        return item
 
-    async def put_one(self, cache_id: str, entity: Person | Genre | Film) -> None:
-        await self.cache.set(cache_id, entity.json(), CACHE_EXPIRE_IN_SECONDS)
+    async def put_one(self, cache_id: str, entity: Person | Genre | Film, generation: bytes | None) -> None:
+        entry = (cache_id, entity, pack_entity(entity), entity_ids(entity), CACHE_EXPIRE_IN_SECONDS)
+        await self._put([entry], generation)
 
-    async def get_many(self, model, cache_id: str) -> list[Film | Person | Genre]:
+    async def get_many(self, cache_id: str) -> list[str] | None:
         logging.info('MAKE: get_many_from_cache')
-        data = await self.cache.get(cache_id)
-        if not data:
-            return None
-        tmp = data[1:-1].split(bytes(DELIMETER.encode('utf-8')))
-        items = []
-        for item in tmp:
-            items.append(model.parse_raw(item))
-        return items
-
-    async def put_many(self, cache_id: str, items: list[Film | Person | Genre]) -> None:
-        items_json = '[' + DELIMETER.join([item.json() for item in items]) + ']'
-        await self.cache.set(cache_id, items_json, CACHE_EXPIRE_IN_SECONDS)
+        ids, _ = await self._get(cache_id, unpack_ids)
+        return ids
+
+    async def put_many(self, cache_id: str, ids: list[str], generation: bytes | None) -> None:
+        await self._put([(cache_id, ids, pack_ids(ids), set(ids) | {self.index}, LIST_EXPIRE_IN_SECONDS)], generation)
+
+    async def get_entities(self, model, ids: list[str]) -> dict:
+        found = {}
+        keys = []
+        for entity_id in ids:
+            item = self.local.get(self.entity_key(entity_id))
+            if item is not None:
+                found[entity_id] = item[0]
+            else:
+                keys.append(entity_id)
+        stats.hits['local'] += len(found)
+        stats.misses['local'] += len(keys)
+        if not keys:
+            return found
+        deadline = time.monotonic() + CACHE_EXPIRE_IN_SECONDS
+        for entity_id, data in zip(keys, await self.cache.mget([self.entity_key(item) for item in keys])):
+            if data is None:
+                stats.miss('redis')
+                continue
+            stats.hit('redis')
+            found[entity_id] = unpack_entity(model, data)
+            self.local.put(self.entity_key(entity_id), found[entity_id], deadline)
+        return found
+
+    async def put_entities(self, entities: dict, generation: bytes | None) -> None:
+        if entities:
+            await self._put(
+                [
+                    (
+                        self.entity_key(entity_id), entity, pack_entity(entity), entity_ids(entity),
+                        CACHE_EXPIRE_IN_SECONDS,
+                    )
+                    for entity_id, entity in entities.items()
+                ],
+                generation,
+            )
+
+    async def _fill(self, ids: list[str], fetch) -> dict:
+        generation = await self.generation()
+        found = await fetch(ids)
+        await self.put_entities(found, generation)
+        return found
+
+    async def hydrate(self, model, ids: list[str], fetch, cache_id: str | None = None) -> list:
+        # Entities of the ids in their order, the ones not cached are read with fetch(ids) -> {id: entity}
+        # in one request and cached. Requests hydrating the same list share that request.
+        found = await self.get_entities(model, ids)
+        missing = [entity_id for entity_id in ids if entity_id not in found]
+        if missing:
+            if cache_id is None:
+                found.update(await self._fill(missing, fetch))
+            else:
+                flight = self._flight(f'{cache_id}:entities', partial(self._fill, missing, fetch))
+                found.update(await asyncio.shield(flight))
+        return [found[entity_id] for entity_id in ids if entity_id in found]
+
+    async def fetch_one(self, cache_id: str, entity: Person | Genre | Film, fetch):
+        # fetch() reads the entity from the storage on a miss, None is not cached
+        return await self._fetch(cache_id, partial(unpack_entity, entity), fetch, self.put_one)
+
+    async def fetch_many(self, model, cache_id: str, fetch_ids, fetch) -> list[Film | Person | Genre]:
+        # fetch_ids() reads the ordered ids of the list, fetch(ids) the entities that are not cached
+        ids = await self._fetch(cache_id, unpack_ids, fetch_ids, self.put_many)
+        if not ids:
+            return ids
+        return await self.hydrate(model, ids, fetch, cache_id)
+
+    async def invalidate(self, *cache_ids: str) -> None:
+        if cache_ids:
+            await self.cache.delete(*cache_ids)
+            self.local.delete(*cache_ids)
+            await self._publish(list(cache_ids))
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f'CACHE: early refresh failed: {task.exception()!r}')
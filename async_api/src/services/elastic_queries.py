@@ -1,4 +1,5 @@
 GET_ALL_FILMS = '''{
+  "_source": false,
   "from": %s,
   "size": %s,
   "query": {
@@ -12,11 +13,21 @@ GET_ALL_FILMS = '''{
 }'''
 
 GET_ALL_FILMS_IN_GENRE = '''{
+  "_source": false,
   "from": %s,
   "size": %s,
   "query": {
-    "terms": {
-      "genres": [ "%s" ]
+    "bool": {
+      "should": [
+        {
+          "nested": {
+            "path": "genres",
+            "ignore_unmapped": true,
+            "query": {"term": {"genres.name": "%s"}}
+          }
+        },
+        {"term": {"genres": "%s"}}
+      ]
     }
   },
   "sort": [
@@ -27,6 +38,7 @@ GET_ALL_FILMS_IN_GENRE = '''{
 }'''
 
 SEARCH_FILMS = '''{
+    "_source": false,
     "from": %s,
     "size": %s,
     "query": {
@@ -45,20 +57,6 @@ SEARCH_FILMS = '''{
 }'''
 
 
-GET_GENRE_BY_NAME = '''{
-    "query": {
-        "bool": {
-            "must": [
-                {
-                    "match": {
-                        "name": "%s"
-                    }
-                }
-            ]
-        }
-    }
-}'''
-
 GET_PERSON_FILMS_AND_ROLES = '''{
   "from": %s,
   "size": %s,
@@ -90,6 +88,7 @@ GET_PERSON_FILMS_AND_ROLES = '''{
 
 
 PERSON_SEARCH = '''{
+  "_source": false,
   "query": {
     "match": {
       "name": {
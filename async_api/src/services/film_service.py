@@ -1,4 +1,4 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 from uuid import UUID
 
 from db.abstruct import CacheInterface, StorageInterface
@@ -15,18 +15,11 @@ INDEX = 'movies'
 class FilmService:
     def __init__(self, redis: CacheInterface, elasticsearch: StorageInterface):
         self.storage = FilmStorage(elasticsearch)
-        self.cache = Cache(redis)
+        self.cache = Cache(redis, INDEX)
 
     async def get_by_id(self, film_id: UUID) -> Film | None:
-        CACHE_ID = '_'.join([INDEX, 'get_by_id', film_id])
-        film = await self.cache.get_one(CACHE_ID, Film)
-        if not film:
-            film = await self.storage.get_by_id(str(film_id))
-            if not film:
-                return None
-            await self.cache.put_one(CACHE_ID, film)
-
-        return film
+        CACHE_ID = self.cache.entity_key(film_id)
+        return await self.cache.fetch_one(CACHE_ID, Film, partial(self.storage.get_by_id, str(film_id)))
 
     async def get_all(
             self,
@@ -36,25 +29,28 @@ class FilmService:
             sort: SortModel | None,
     ) -> list[Film]:
         CACHE_ID = '_'.join([INDEX, 'get_all_films', str(page_size), str(page_number), str(genre), str(sort)])
-        films = await self.cache.get_many(Film, CACHE_ID)
-        if not films:
-            films = await self.storage.get_all(page_size, page_number, genre, sort)
-            if not films:
-                return None
-            await self.cache.put_many(CACHE_ID, films)
+        films = await self.cache.fetch_many(
+            Film, CACHE_ID, partial(self.storage.get_all, page_size, page_number, genre, sort), self.storage.get_many,
+        )
+        return films or None
 
-        return films
+    async def get_page(
+            self,
+            page_size: int,
+            cursor: str,
+            genre: str | None = None,
+            sort: SortModel | None = None,
+    ) -> tuple[list[Film], str | None]:
+        # cursor pages are not cached as lists, every walk has its own point in time
+        film_ids, next_cursor = await self.storage.get_page(page_size, cursor, genre, sort)
+        return await self.cache.hydrate(Film, film_ids, self.storage.get_many), next_cursor
 
     async def search(self, query: str, page_size: int, page_number: int) -> list[Film] | None:
         CACHE_ID = '_'.join([INDEX, 'film_search', str(query), str(page_size), str(page_number)])
-        films = await self.cache.get_many(Film, CACHE_ID)
-        if not films:
-            films = await self.storage.search(query, page_size, page_number)
-            if not films:
-                return None
-            await self.cache.put_many(CACHE_ID, films)
-
-        return films
+        films = await self.cache.fetch_many(
+            Film, CACHE_ID, partial(self.storage.search, query, page_size, page_number), self.storage.get_many,
+        )
+        return films or None
 
 
 @lru_cache
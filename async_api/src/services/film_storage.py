@@ -6,7 +6,8 @@ from models.genre import Genre
 from models.person import Person
 from services.abstract_storage import AbstractStorage
 from services.elastic_queries import (GET_ALL_FILMS, GET_ALL_FILMS_IN_GENRE,
-                                      GET_GENRE_BY_NAME, SEARCH_FILMS)
+                                      SEARCH_FILMS)
+from services.pagination import PointInTime
 
 INDEX = 'movies'
 
@@ -14,6 +15,7 @@ INDEX = 'movies'
 class FilmStorage(AbstractStorage):
     def __init__(self, storage: StorageInterface):
         self.storage = storage
+        self.pit = PointInTime(storage, INDEX)
 
     @backoff.on_exception(
         backoff.expo,
@@ -26,12 +28,54 @@ class FilmStorage(AbstractStorage):
             doc = await self.storage.get(index='movies', id=film_id)
         except NotFoundError:
             return None
-        row = doc['_source']
+        return self._film(doc['_source'], await self._legacy_genres([doc['_source']]))
+
+    async def _legacy_genres(self, rows: list[dict]) -> dict[str, Genre]:
+        # Documents indexed before genres became {id, name} objects keep plain genre names until
+        # the movies index is rebuilt, those genres are looked up by name in one search
+        names = {item for row in rows for item in row['genres'] if isinstance(item, str)}
+        if not names:
+            return {}
+        doc = await self.storage.search(
+            index='genres',
+            body={
+                'size': 10 * len(names),
+                'query': {'bool': {'should': [{'match_phrase': {'name': name}} for name in names]}},
+            },
+        )
+        return {
+            hit['_source']['name']: Genre(**hit['_source'])
+            for hit in doc['hits']['hits']
+            if hit['_source']['name'] in names
+        }
+
+    @staticmethod
+    def _genre_query(genre: str) -> dict:
+        # Matches the nested {id, name} genres and, until the movies index is rebuilt, the plain
+        # keyword ones: each clause finds nothing on the other mapping instead of failing
+        return {
+            'bool': {
+                'should': [
+                    {
+                        'nested': {
+                            'path': 'genres',
+                            'ignore_unmapped': True,
+                            'query': {'term': {'genres.name': genre}},
+                        },
+                    },
+                    {'term': {'genres': genre}},
+                ],
+            },
+        }
+
+    @staticmethod
+    def _film(row: dict, legacy_genres: dict | None = None) -> Film:
         genre = []
-        for el in row['genres']:
-            query_genre = GET_GENRE_BY_NAME % (el)
-            doc_genre = await self.storage.search(body=query_genre, index='genres')
-            genre.append(Genre(**doc_genre['hits']['hits'][0]['_source']))
+        for item in row['genres']:
+            if isinstance(item, dict):
+                genre.append(Genre(**item))
+            elif legacy_genres and item in legacy_genres:
+                genre.append(legacy_genres[item])
 
         directors = [Person(**person) for person in row['directors']]
         actors = [Person(**person) for person in row['actors']]
@@ -48,6 +92,18 @@ class FilmStorage(AbstractStorage):
             writers=writers,
         )
 
+    @backoff.on_exception(
+        backoff.expo,
+        (ElasticsearchException,),
+        max_tries=3,
+        jitter=backoff.random_jitter,
+    )
+    async def get_many(self, film_ids: list[str]) -> dict[str, Film]:
+        doc = await self.storage.mget(index=INDEX, body={'ids': film_ids})
+        rows = [item for item in doc['docs'] if item.get('found')]
+        legacy_genres = await self._legacy_genres([item['_source'] for item in rows])
+        return {item['_id']: self._film(item['_source'], legacy_genres) for item in rows}
+
     @backoff.on_exception(
         backoff.expo,
         (ElasticsearchException,),
@@ -60,10 +116,10 @@ class FilmStorage(AbstractStorage):
             page_number: int,
             genre: str | None,
             sort: SortModel | None,
-    ) -> list[Film]:
+    ) -> list[str]:
         sort_mode = 'asc' if sort == SortModel.ascending else 'desc'
         if genre:
-            query = GET_ALL_FILMS_IN_GENRE % (page_size * page_number, page_size, genre, sort_mode)
+            query = GET_ALL_FILMS_IN_GENRE % (page_size * page_number, page_size, genre, genre, sort_mode)
         else:
             query = GET_ALL_FILMS % (page_size * page_number, page_size, sort_mode)
 
@@ -72,18 +128,23 @@ class FilmStorage(AbstractStorage):
         if page_size * page_number >= total_size:
             return None
 
-        data = doc['hits']['hits']
-        films = []
-        for row_with_meta in data:
-            row = row_with_meta['_source']
-            films.append(
-                Film(
-                    id=row['id'],
-                    title=row['title'],
-                    imdb_rating=row['imdb_rating'],
-                ),
-            )
-        return films
+        return [hit['_id'] for hit in doc['hits']['hits']]
+
+    async def get_page(
+            self,
+            page_size: int,
+            cursor: str,
+            genre: str | None,
+            sort: SortModel | None,
+    ) -> tuple[list[str], str | None]:
+        sort_mode = 'asc' if sort == SortModel.ascending else 'desc'
+        if genre:
+            query = self._genre_query(genre)
+        else:
+            query = {'match_all': {}}
+        # films without a rating sort as 0, so the sort values in the cursor stay plain numbers
+        sort = [{'imdb_rating': {'order': sort_mode, 'missing': 0}}, {'id': 'asc'}]
+        return await self.pit.page(query, sort, page_size, cursor)
 
     @backoff.on_exception(
         backoff.expo,
@@ -91,22 +152,11 @@ class FilmStorage(AbstractStorage):
         max_tries=3,
         jitter=backoff.random_jitter,
     )
-    async def search(self, query: str, page_size: int, page_number: int) -> list[Film] | None:
+    async def search(self, query: str, page_size: int, page_number: int) -> list[str] | None:
         query = SEARCH_FILMS % (page_size * page_number, page_size, query)
         doc = await self.storage.search(body=query, index='movies')
         total_size = doc['hits']['total']['value']
         if total_size == 0:
             return None
 
-        data = doc['hits']['hits']
-        resp = []
-        for row_with_meta in data:
-            row = row_with_meta['_source']
-            resp.append(
-                Film(
-                    id=row['id'],
-                    title=row['title'],
-                    imdb_rating=row['imdb_rating'],
-                ),
-            )
-        return resp
+        return [hit['_id'] for hit in doc['hits']['hits']]
@@ -1,4 +1,4 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 
 from db.abstruct import CacheInterface, StorageInterface
 from db.elastic import get_elastic
@@ -14,7 +14,7 @@ INDEX = 'genres'
 class GenreService:
     def __init__(self, redis: CacheInterface, elasticsearch: StorageInterface):
         self.storage = GenreStorage(elasticsearch)
-        self.cache = Cache(redis)
+        self.cache = Cache(redis, INDEX)
 
     async def get_all(
         self,
@@ -22,23 +22,18 @@ class GenreService:
         page_number: int = 0,
     ) -> list[Genre]:
         CACHE_ID = '_'.join([INDEX, 'get_all', str(page_size), str(page_number)])
-        genres = await self.cache.get_many(Genre, CACHE_ID)
-        if not genres:
-            genres = await self.storage.get_all(page_size, page_number)
-            if not genres:
-                return None
-            await self.cache.put_many(CACHE_ID, genres)
-        return genres
+        genres = await self.cache.fetch_many(
+            Genre, CACHE_ID, partial(self.storage.get_all, page_size, page_number), self.storage.get_many,
+        )
+        return genres or None
+
+    async def get_page(self, page_size: int, cursor: str) -> tuple[list[Genre], str | None]:
+        genre_ids, next_cursor = await self.storage.get_page(page_size, cursor)
+        return await self.cache.hydrate(Genre, genre_ids, self.storage.get_many), next_cursor
 
     async def get_by_id(self, genre_id: str) -> Genre | None:
-        CACHE_ID = '_'.join([INDEX, 'get_by_id', genre_id])
-        genre = await self.cache.get_one(CACHE_ID, Genre)
-        if not genre:
-            genre = await self.storage.get_by_id(genre_id)
-            if not genre:
-                return None
-            await self.cache.put_one(CACHE_ID, genre)
-        return genre
+        CACHE_ID = self.cache.entity_key(genre_id)
+        return await self.cache.fetch_one(CACHE_ID, Genre, partial(self.storage.get_by_id, genre_id))
 
     async def search(self, key: str, page_size: int = 50, page_number: int = 0) -> list[Genre]:
         return await self.search(key, page_size, page_number)
@@ -3,6 +3,7 @@ from db.abstruct import StorageInterface
 from elasticsearch import ElasticsearchException, NotFoundError
 from models.genre import Genre
 from services.abstract_storage import AbstractStorage
+from services.pagination import PointInTime
 
 INDEX = 'genres'
 
@@ -10,6 +11,7 @@ INDEX = 'genres'
 class GenreStorage(AbstractStorage):
     def __init__(self, storage: StorageInterface):
         self.storage = storage
+        self.pit = PointInTime(storage, INDEX)
 
     @backoff.on_exception(
         backoff.expo,
@@ -17,18 +19,22 @@ class GenreStorage(AbstractStorage):
         max_tries=3,
         jitter=backoff.random_jitter,
     )
-    async def get_all(self, page_size: int, page_number: int) -> list[Genre]:
+    async def get_all(self, page_size: int, page_number: int) -> list[str]:
         try:
             doc = await self.storage.search(
                 index=INDEX,
                 body={
+                    '_source': False,
                     'size': page_size,
                     'from': page_number,
                 },
             )
         except NotFoundError:
             return None
-        return [Genre(**hit['_source']) for hit in doc['hits']['hits']]
+        return [hit['_id'] for hit in doc['hits']['hits']]
+
+    async def get_page(self, page_size: int, cursor: str) -> tuple[list[str], str | None]:
+        return await self.pit.page({'match_all': {}}, [{'id': 'asc'}], page_size, cursor)
 
     @backoff.on_exception(
         backoff.expo,
@@ -43,6 +49,16 @@ class GenreStorage(AbstractStorage):
             return None
         return Genre(**doc['_source'])
 
+    @backoff.on_exception(
+        backoff.expo,
+        (ElasticsearchException,),
+        max_tries=3,
+        jitter=backoff.random_jitter,
+    )
+    async def get_many(self, genre_ids: list[str]) -> dict[str, Genre]:
+        doc = await self.storage.mget(index=INDEX, body={'ids': genre_ids})
+        return {item['_id']: Genre(**item['_source']) for item in doc['docs'] if item.get('found')}
+
     @backoff.on_exception(
         backoff.expo,
         (ElasticsearchException,),
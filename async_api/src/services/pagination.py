@@ -0,0 +1,114 @@
+import base64
+import binascii
+import logging
+import zlib
+
+import backoff
+import orjson
+from core.config import settings
+from db.abstruct import StorageInterface
+from elasticsearch import ElasticsearchException, NotFoundError, RequestError
+
+# a cursor that starts a new walk over the index
+FIRST_PAGE = '*'
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(token: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(token)).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        token = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as error:
+        raise CursorError('invalid cursor') from error
+    if not isinstance(token, dict) or not {'pit', 'after', 'query'} <= token.keys():
+        raise CursorError('invalid cursor')
+    return token
+
+
+class PointInTime:
+    # Cursor pagination: every walk opens a point-in-time reader of the index, so pages do not
+    # shift while the index changes, and each page continues after the sort values of the last hit
+    # (search_after) instead of skipping `from` hits. The cursor handed to the client keeps the
+    # reader id, those sort values and a checksum of the query it was opened for.
+    def __init__(self, storage: StorageInterface, index: str):
+        self.storage = storage
+        self.index = index
+        self.keep_alive = settings.elastic_pit_keep_alive
+
+    @backoff.on_exception(
+        backoff.expo,
+        (ElasticsearchException,),
+        max_tries=3,
+        jitter=backoff.random_jitter,
+    )
+    async def _open(self) -> str:
+        # the 7.x client has no point-in-time helpers
+        doc = await self.storage.transport.perform_request(
+            'POST', f'/{self.index}/_pit', params={'keep_alive': self.keep_alive},
+        )
+        return doc['id']
+
+    async def _close(self, pit_id: str) -> None:
+        # a reader that is not closed expires after keep_alive anyway
+        try:
+            await self.storage.transport.perform_request('DELETE', '/_pit', body={'id': pit_id})
+        except ElasticsearchException as error:
+            logging.warning(f'PIT {self.index}: reader is not closed: {error!r}')
+
+    @backoff.on_exception(
+        backoff.expo,
+        (ElasticsearchException,),
+        max_tries=3,
+        jitter=backoff.random_jitter,
+        giveup=lambda error: isinstance(error, (NotFoundError, RequestError)),
+    )
+    async def _search(self, body: dict) -> dict:
+        return await self.storage.search(body=body)
+
+    async def page(self, query: dict, sort: list, page_size: int, cursor: str) -> tuple[list[str], str | None]:
+        # ids of the page and the cursor of the next one, None on the last page
+        checksum = zlib.crc32(orjson.dumps([query, sort]))
+        if cursor == FIRST_PAGE:
+            pit_id, after = await self._open(), None
+        else:
+            token = decode_cursor(cursor)
+            if token['query'] != checksum:
+                raise CursorError('cursor was opened for other parameters')
+            pit_id, after = token['pit'], token['after']
+
+        # one hit more than the page tells whether there is a next page
+        body = {
+            '_source': False,
+            'size': page_size + 1,
+            'query': query,
+            'sort': sort,
+            'track_total_hits': False,
+            'pit': {'id': pit_id, 'keep_alive': self.keep_alive},
+        }
+        if after:
+            body['search_after'] = after
+        try:
+            doc = await self._search(body)
+        except ElasticsearchException as error:
+            # the reader of a new walk is closed here, the one of a cursor stays for a retry with it
+            if after is None:
+                await self._close(pit_id)
+                raise
+            if isinstance(error, (NotFoundError, RequestError)):
+                raise CursorError('invalid or expired cursor') from error
+            raise
+
+        hits = doc['hits']['hits'][:page_size]
+        ids = [hit['_id'] for hit in hits]
+        pit_id = doc.get('pit_id', pit_id)
+        if len(doc['hits']['hits']) <= page_size:
+            await self._close(pit_id)
+            return ids, None
+        return ids, encode_cursor({'pit': pit_id, 'after': hits[-1]['sort'], 'query': checksum})
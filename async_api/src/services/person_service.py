@@ -1,10 +1,10 @@
-from functools import lru_cache
+from functools import lru_cache, partial
 
 from db.abstruct import CacheInterface, StorageInterface
 from db.elastic import get_elastic
 from db.redis import get_redis
 from fastapi import Depends
-from models.person import Person, PersonFilmsRoles
+from models.person import PersonFilmsRoles
 from services.abstract_service import AbstractService
 from services.cache import Cache
 from services.person_storage import PersonStorage
@@ -15,31 +15,28 @@ INDEX = 'persons'
 class PersonService(AbstractService):
     def __init__(self, redis: CacheInterface, elasticsearch: StorageInterface):
         self.storage = PersonStorage(elasticsearch)
-        self.cache = Cache(redis)
+        self.cache = Cache(redis, INDEX)
 
     async def get_all(self, page_size: int = 50, page_number: int = 0):
         CACHE_ID = '_'.join([INDEX, str(page_size), str(page_number)])
-        persons = await self.cache.get_many(Person, CACHE_ID)
-        if not persons:
-            persons = await self.storage.get_all(page_size, page_number)
-            if not persons:
-                return None
-            await self.cache.put_many(CACHE_ID, persons)
-        return persons
+        persons = await self.cache.fetch_many(
+            PersonFilmsRoles, CACHE_ID, partial(self.storage.get_all, page_size, page_number), self.storage.get_many,
+        )
+        return persons or None
+
+    async def get_page(self, page_size: int, cursor: str) -> tuple[list[PersonFilmsRoles], str | None]:
+        person_ids, next_cursor = await self.storage.get_page(page_size, cursor)
+        return await self.cache.hydrate(PersonFilmsRoles, person_ids, self.storage.get_many), next_cursor
 
     async def get_by_id(self, person_id: str) -> PersonFilmsRoles | None:
-        CACHE_ID = '_'.join([INDEX, 'get_by_id', person_id])
-        person = await self.cache.get_one(CACHE_ID, PersonFilmsRoles)
-        if not person:
-            person = await self.storage.get_by_id(person_id)
-            if not person:
-                return None
-            await self.cache.put_one(CACHE_ID, person)
-        return person
+        CACHE_ID = self.cache.entity_key(person_id)
+        return await self.cache.fetch_one(CACHE_ID, PersonFilmsRoles, partial(self.storage.get_by_id, person_id))
 
     async def search(self, key: str, page_size: int = 50, page_number: int = 0) -> list[PersonFilmsRoles]:
-        persons = await self.storage.search(key, page_size, page_number)
-        return [await self.storage.get_by_id(person.id) for person in persons]
+        person_ids = await self.storage.search(key, page_size, page_number)
+        if not person_ids:
+            return person_ids
+        return await self.cache.hydrate(PersonFilmsRoles, person_ids, self.storage.get_many)
 
     async def get_person_films(self, person_id, page_size: int = 50, page_number: int = 0):
         return await self.storage.get_person_films(person_id, page_size, page_number)
@@ -2,9 +2,10 @@ import backoff
 import elasticsearch
 from elasticsearch import ElasticsearchException, NotFoundError
 from models.film import ShortFilm
-from models.person import FilmsByPerson, Person, PersonFilmsRoles
+from models.person import FilmsByPerson, PersonFilmsRoles
 from services.abstract_storage import AbstractStorage
 from services.elastic_queries import GET_PERSON_FILMS_AND_ROLES, PERSON_SEARCH
+from services.pagination import PointInTime
 
 INDEX = 'persons'
 
@@ -13,6 +14,7 @@ class PersonStorage(AbstractStorage):
 
     def __init__(self, storage):
         self.storage = storage
+        self.pit = PointInTime(storage, INDEX)
 
     @backoff.on_exception(
         backoff.expo,
@@ -20,18 +22,22 @@ class PersonStorage(AbstractStorage):
         max_tries=3,
         jitter=backoff.random_jitter,
     )
-    async def get_all(self, page_size: int = 50, page_number: int = 0) -> list[Person]:
+    async def get_all(self, page_size: int = 50, page_number: int = 0) -> list[str]:
         try:
             doc = await self.storage.search(
                 index=INDEX,
                 body={
+                    '_source': False,
                     'size': page_size,
                     'from': page_number * page_size,
                 },
             )
         except elasticsearch.NotFoundError:
             return None
-        return [Person(**hit['_source']) for hit in doc['hits']['hits']]
+        return [hit['_id'] for hit in doc['hits']['hits']]
+
+    async def get_page(self, page_size: int, cursor: str) -> tuple[list[str], str | None]:
+        return await self.pit.page({'match_all': {}}, [{'id': 'asc'}], page_size, cursor)
 
     @backoff.on_exception(
         backoff.expo,
@@ -44,36 +50,28 @@ class PersonStorage(AbstractStorage):
         page_size: int = 50,
         page_number: int = 0,
     ) -> PersonFilmsRoles:
+        # the filmography with roles is stored in the person document by the ETL
         try:
             doc_person = await self.storage.get(index=INDEX, id=person_id)
-            doc_films = await self.storage.search(
-                index='movies',
-                body=GET_PERSON_FILMS_AND_ROLES % (page_number * page_size, page_size, person_id, person_id, person_id),
-            )
         except NotFoundError:
             return None
-        films = []
-
-        for hit in doc_films['hits']['hits']:
-            film = hit['_source']
-            roles = []
+        return self._person(doc_person['_source'], page_size, page_number)
 
-            for item in film['actors']:
-                if item['id'] == person_id:
-                    roles.append('actor')
-                    break
-            for item in film['writers']:
-                if item['id'] == person_id:
-                    roles.append('writer')
-                    break
-            for item in film['directors']:
-                if item['id'] == person_id:
-                    roles.append('director')
-                    break
+    @staticmethod
+    def _person(person: dict, page_size: int = 50, page_number: int = 0) -> PersonFilmsRoles:
+        start = page_number * page_size
+        films = [FilmsByPerson(**film) for film in person.pop('films', [])[start:start + page_size]]
+        return PersonFilmsRoles(films=films, **person)
 
-            fp = FilmsByPerson(id=film['id'], roles=roles)
-            films.append(fp)
-        return PersonFilmsRoles(films=films, **doc_person['_source'])
+    @backoff.on_exception(
+        backoff.expo,
+        (ElasticsearchException,),
+        max_tries=3,
+        jitter=backoff.random_jitter,
+    )
+    async def get_many(self, person_ids: list[str]) -> dict[str, PersonFilmsRoles]:
+        doc = await self.storage.mget(index=INDEX, body={'ids': person_ids})
+        return {item['_id']: self._person(item['_source']) for item in doc['docs'] if item.get('found')}
 
     @backoff.on_exception(
         backoff.expo,
@@ -81,7 +79,7 @@ class PersonStorage(AbstractStorage):
         max_tries=3,
         jitter=backoff.random_jitter,
     )
-    async def search(self, key: str, page_size: int = 50, page_number: int = 0) -> list[Person]:
+    async def search(self, key: str, page_size: int = 50, page_number: int = 0) -> list[str]:
         query = PERSON_SEARCH % key
         try:
             doc = await self.storage.search(
@@ -90,7 +88,7 @@ class PersonStorage(AbstractStorage):
             )
         except NotFoundError:
             return None
-        return [Person(**hit['_source']) for hit in doc['hits']['hits']]
+        return [hit['_id'] for hit in doc['hits']['hits']]
 
     async def get_person_films(self, person_id: str, page_size: int = 50, page_number: int = 0) -> list[ShortFilm]:
         doc_movies = await self.storage.search(
@@ -196,3 +196,44 @@ async def test_get_all_films_cache_time(path, aiohttp_client, es_write_data, red
     redis_time /= NUM_ITERS
 
     assert redis_time < es_time
+
+
+@pytest.mark.parametrize(
+    'params', 
+    [
+        {"page_size": 7, "genre": None, "sort": "-imdb_rating", "count": 100},
+        {"page_size": 25, "genre": None, "sort": "imdb_rating", "count": 100},
+        {"page_size": 1, "genre": "Biography", "sort": "-imdb_rating", "count": 2},
+    ],
+    ids=["Desc", "Asc", "Genre"]
+)
+@pytest.mark.asyncio
+async def test_get_all_films_cursor(params, aiohttp_client, es_write_data, event_loop):
+    query_params = {key: value for key, value in params.items() if key != "count" and value is not None}
+    cursor = "*"
+    films = []
+    while cursor:
+        async with aiohttp_client.get(
+            f'http://{test_settings.service_host}:{test_settings.service_port}/api/v1/films',
+            params={**query_params, "cursor": cursor},
+        ) as resp:
+            assert resp.status == HTTPStatus.OK
+            data = await resp.json()
+            assert 0 < len(data) <= params["page_size"]
+            films += data
+            cursor = resp.headers.get("X-Next-Cursor")
+
+    assert len(films) == params["count"]
+    assert len({film["id"] for film in films}) == params["count"]
+    ratings = [film["imdb_rating"] for film in films]
+    assert ratings == sorted(ratings, reverse=params["sort"].startswith("-"))
+
+
+@pytest.mark.asyncio
+async def test_get_all_films_invalid_cursor(aiohttp_client, es_write_data, event_loop):
+    async with aiohttp_client.get(
+        f'http://{test_settings.service_host}:{test_settings.service_port}/api/v1/films',
+        params={"cursor": "not-a-cursor"},
+    ) as resp:
+        assert resp.status == HTTPStatus.BAD_REQUEST
+        assert list((await resp.json()).keys()) == ["detail"]
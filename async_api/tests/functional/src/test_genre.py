@@ -105,4 +105,21 @@ async def test_get_all_genres_cache(params, aiohttp_client, es_write_data, redis
         ) as resp:
 
         result = await redis_client.get(cache_id)
-        assert result is not None
\ No newline at end of file
+        assert result is not None
+
+@pytest.mark.asyncio
+async def test_get_all_genres_cursor(aiohttp_client, es_write_data, event_loop):
+    cursor = "*"
+    genres = []
+    while cursor:
+        async with aiohttp_client.get(
+            f'http://{test_settings.service_host}:{test_settings.service_port}/api/v1/genres',
+            params={"page_size": 4, "cursor": cursor},
+        ) as resp:
+            assert resp.status == HTTPStatus.OK
+            genres += await resp.json()
+            cursor = resp.headers.get("X-Next-Cursor")
+
+    ids = [genre["id"] for genre in genres]
+    assert len(ids) == 26
+    assert ids == sorted(set(ids))
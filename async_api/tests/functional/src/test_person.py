@@ -3,10 +3,10 @@
 # поиск всех фильмов с участием человека;
 # вывести всех людей;
 # поиск с учётом кеша в Redis.
-import json
 import uuid
 from http import HTTPStatus
 
+import msgpack
 import pytest
 from tests.functional.settings import test_settings
 
@@ -255,7 +255,7 @@ async def test_get_get_person_by_id_from_cache(make_request, es_write_data, redi
     assert response.status == HTTPStatus.OK
     assert response.body['id'] == answer['id']
 
-    res = json.loads(await redis_client.get('_'.join(['persons', 'get_by_id', params['id']])))
+    res = msgpack.unpackb(await redis_client.get('_'.join(['persons', 'get_by_id', params['id']])))
 
     assert res['id'] == answer['id']
     assert res['name'] == answer['name']
@@ -292,4 +292,4 @@ async def test_get_all_persons_from_cache(make_request, es_write_data, redis_cli
     res = await redis_client.get('_'.join(['persons', str(params['page_size']), str(params['page_number'])]))
 
     assert res is not None
-    assert len(res.split(sep=b'<delimiter>')) == answer['length']
+    assert len(msgpack.unpackb(res)) == answer['length']
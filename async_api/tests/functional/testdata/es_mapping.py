@@ -66,7 +66,19 @@ MOVIES = '''
             },
             "genres":
             {
-                "type": "keyword"
+                "type": "nested",
+                "dynamic": "strict",
+                "properties":
+                {
+                    "id":
+                    {
+                        "type": "keyword"
+                    },
+                    "name":
+                    {
+                        "type": "keyword"
+                    }
+                }
             },
             "title":
             {
@@ -150,6 +162,10 @@ MOVIES = '''
                         "analyzer": "ru_en"
                     }
                 }
+            },
+            "modified":
+            {
+                "type": "date"
             }
         }
     }
@@ -222,6 +238,31 @@ PERSONS = '''{
             {
                 "type": "text",
                 "analyzer": "ru_en"
+            },
+            "films":
+            {
+                "type": "nested",
+                "dynamic": "strict",
+                "properties":
+                {
+                    "id":
+                    {
+                        "type": "keyword"
+                    },
+                    "title":
+                    {
+                        "type": "text",
+                        "analyzer": "ru_en"
+                    },
+                    "roles":
+                    {
+                        "type": "keyword"
+                    }
+                }
+            },
+            "modified":
+            {
+                "type": "date"
             }
         }
     }
@@ -299,6 +340,10 @@ GENRES = '''{
             {
                 "type": "text",
                 "analyzer": "ru_en"
+            },
+            "modified":
+            {
+                "type": "date"
             }
         }
     }
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from contextlib import aclosing
 from functools import wraps
 
 import aiohttp
@@ -12,18 +13,22 @@ def backoff_generator(start_sleep_time=0.1, factor=2, border_sleep_time=10, max_
     def func_wrapper(func):
         @wraps(func)
         async def inner(*args, **kwargs):
-            nonlocal start_sleep_time
-            for _ in range(max_tries):
+            sleep_time = start_sleep_time
+            for attempt in range(max_tries):
                 try:
-                    async for res in func(*args, **kwargs):
-                        logging.info(f'Rows changed: {len(res)}')
-                        yield res
+                    async with aclosing(func(*args, **kwargs)) as rows:
+                        async for res in rows:
+                            logging.info(f'Rows changed: {len(res)}')
+                            yield res
                     return
                 except psycopg.DatabaseError:
-                    await asyncio.sleep(start_sleep_time)
-                    start_sleep_time = min(factor * start_sleep_time, border_sleep_time)
+                    if attempt == max_tries - 1:
+                        raise
+                    await asyncio.sleep(sleep_time)
+                    sleep_time = min(factor * sleep_time, border_sleep_time)
                 except Exception as e:
-                    logging.warn('Error with data syncronization: some data is not loaded in Elastic', e)
+                    logging.warning(f'Error with data syncronization: some data is not loaded in Elastic: {e}')
+                    raise
         return inner
     return func_wrapper
 
@@ -32,16 +37,17 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, max_tries=100)
     def func_wrapper(func):
         @wraps(func)
         async def inner(*args, **kwargs):
-            nonlocal start_sleep_time
-            for _ in range(max_tries):
+            sleep_time = start_sleep_time
+            for attempt in range(max_tries):
                 try:
-                    await func(*args, **kwargs)
-                    return
-                except aiohttp.ClientResponseError:
-                    await asyncio.sleep(start_sleep_time)
-                    start_sleep_time = min(factor * start_sleep_time, border_sleep_time)
+                    return await func(*args, **kwargs)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == max_tries - 1:
+                        raise
+                    await asyncio.sleep(sleep_time)
+                    sleep_time = min(factor * sleep_time, border_sleep_time)
                 except Exception as e:
-                    logging.warn('Error with data syncronization: some data is not loaded in Elastic', e)
-                    return
+                    logging.warning(f'Error with data syncronization: some data is not loaded in Elastic: {e}')
+                    raise
         return inner
     return func_wrapper
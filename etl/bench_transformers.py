@@ -0,0 +1,80 @@
+"""Rows/sec of the ETL transformers on synthetic rows.
+
+    python bench_transformers.py [--rows 100000] [--batch 1000] [--processes 0]
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import time
+import uuid
+
+from transformers import TransformerGenres, TransformerMovies, TransformerPersons
+
+ROLES = ('actor', 'director', 'writer')
+GENRES = ('Action', 'Comedy', 'Drama', 'Documentary', 'Fantasy', 'Sci-Fi', 'Thriller')
+
+
+def movie_rows(count):
+    modified = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for _ in range(count):
+        persons = random.randint(0, 20)
+        rows.append((
+            uuid.uuid4(),
+            f'Title {random.random()}',
+            'Description ' * random.randint(0, 40),
+            round(random.uniform(0, 10), 1),
+            [uuid.uuid4() for _ in range(persons)],
+            [random.choice(ROLES) for _ in range(persons)],
+            [f'Person {random.random()}' for _ in range(persons)],
+            [{'id': str(uuid.uuid4()), 'name': name} for name in sorted(random.sample(GENRES, random.randint(1, 3)))],
+            modified,
+        ))
+    return rows
+
+
+def person_rows(count):
+    modified = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        (
+            uuid.uuid4(),
+            f'Person {random.random()}',
+            [
+                {'id': str(uuid.uuid4()), 'title': f'Title {random.random()}', 'roles': [random.choice(ROLES)]}
+                for _ in range(random.randint(0, 10))
+            ],
+            modified,
+        )
+        for _ in range(count)
+    ]
+
+
+def genre_rows(count):
+    modified = datetime.datetime.now(datetime.timezone.utc)
+    return [(uuid.uuid4(), f'Genre {random.random()}', 'Description ' * 10, modified) for _ in range(count)]
+
+
+async def measure(transformer, rows, batch):
+    t1 = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        await transformer.start(rows[i:i + batch])
+    return len(rows) / (time.perf_counter() - t1)
+
+
+async def main(args):
+    for transformer, rows in (
+        (TransformerMovies, movie_rows(args.rows)),
+        (TransformerPersons, person_rows(args.rows)),
+        (TransformerGenres, genre_rows(args.rows)),
+    ):
+        rate = await measure(transformer(processes=args.processes, min_rows=1), rows, args.batch)
+        print(f'{transformer.__name__}: {rate:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
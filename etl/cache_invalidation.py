@@ -0,0 +1,52 @@
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+# KEYS[1] is the cache generation of the index, the rest are tag sets of the API cache. ARGV[1] is
+# the channel the API workers drop local copies on. Tagged keys are deleted in chunks, unpack() has
+# a limit on the number of arguments.
+INVALIDATE = '''
+local keys = {}
+local seen = {}
+for i = 2, #KEYS do
+    for _, key in ipairs(redis.call('SMEMBERS', KEYS[i])) do
+        if not seen[key] then
+            seen[key] = true
+            table.insert(keys, key)
+        end
+    end
+end
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+redis.call('DEL', unpack(KEYS, 2))
+redis.call('INCR', KEYS[1])
+if #keys > 0 then
+    redis.call('PUBLISH', ARGV[1], cjson.encode({origin = 'etl', keys = keys}))
+end
+return #keys
+'''
+
+
+class CacheInvalidator:
+    # The API tags every cached entity with its id and the ids nested in it, and every list with
+    # the index name. Indexed and deleted ids evict the entities they are in. Any change can move
+    # a document into a list or a search page it was not in, so every change evicts the lists.
+    #
+    # Every invalidation bumps the cache generation of the index. The API reads it before it
+    # fetches from Elastic and does not cache the result if it changed meanwhile, so a fetch that
+    # started before a change cannot put the old data back after the eviction.
+    def __init__(self, redis_adapter, prefix='cache:tag', channel='cache:invalidate', generation='cache:generation'):
+        self.prefix = prefix
+        self.channel = channel
+        self.generation = generation
+        self._invalidate = redis_adapter.register_script(INVALIDATE)
+
+    def invalidate(self, index: str, ids):
+        if not ids:
+            return
+        tags = [f'{self.prefix}:{item}' for item in ids]
+        tags.append(f'{self.prefix}:{index}')
+        evicted = self._invalidate(keys=[f'{self.generation}:{index}', *tags], args=[self.channel])
+        if evicted:
+            logging.info(f'CACHE {index}: {evicted} cached responses evicted')
@@ -0,0 +1,55 @@
+from leases import shard_of
+
+
+class DirtySet:
+    def __init__(self, redis_adapter, key='movies:dirty', shards=1):
+        # With several shards every id goes to the set of its shard, every shard is worked on separately
+        self.redis_adapter = redis_adapter
+        self.key = key
+        self.shards = shards
+        self.processing_key = f'{key}:processing'
+
+    def part(self, shard: int):
+        if self.shards == 1:
+            return self
+        return DirtySet(self.redis_adapter, f'{self.key}:{shard}')
+
+    async def start(self, ids):
+        if not ids:
+            return
+        if self.shards == 1:
+            self.redis_adapter.sadd(self.key, *ids)
+            return
+        parts = {}
+        for item in ids:
+            parts.setdefault(shard_of(item, self.shards), []).append(item)
+        for shard, items in parts.items():
+            self.redis_adapter.sadd(self.part(shard).key, *items)
+
+    def begin_cycle(self):
+        # Changes collected so far become this cycle's work set. A work set left by a crashed
+        # cycle is finished first, new changes wait in the dirty set for the next cycle.
+        if self.redis_adapter.exists(self.key):
+            self.redis_adapter.renamenx(self.key, self.processing_key)
+
+    def scan(self, count):
+        # SSCAN returns every member that stays in the set at least once, duplicates are dropped
+        seen = set()
+        batch = []
+        for item in self.redis_adapter.sscan_iter(self.processing_key, count=count):
+            if item in seen:
+                continue
+            seen.add(item)
+            batch.append(item)
+            if len(batch) >= count:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def done(self, ids):
+        if ids:
+            self.redis_adapter.srem(self.processing_key, *ids)
+
+    def size(self):
+        return self.redis_adapter.scard(self.processing_key)
@@ -1,89 +1,323 @@
 import asyncio
 import json
 import logging
+import os
+import time
+from http import HTTPStatus
 
 import aiohttp
+import metrics
 from backoff import backoff
 
 logging.basicConfig(level=logging.INFO)
 
-class LoaderMovies:
-    def __init__(self, host: str, port: int, index: str):
-        self.host = host
-        self.port = port
-        self.index = index
+RETRY_STATUSES = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+class BulkError(Exception):
+    def __init__(self, ids):
+        super().__init__(f'{len(ids)} documents are not loaded in Elastic')
+        self.ids = ids
+
+
+class UpdateConflictError(Exception):
+    pass
+
+
+class UpdateTaskError(Exception):
+    pass
+
+
+class BulkEngine:
+    def __init__(self, host: str, port: int, concurrency: int | None = None):
+        self.base_url = f'http://{host}:{port}'
+        self.url = f'{self.base_url}/_bulk'
+        self.concurrency = concurrency or int(os.environ.get('ES_BULK_CONCURRENCY', 4))
+        self.max_bytes = int(os.environ.get('ES_BULK_MAX_BYTES', 5 * 1024 * 1024))
+        self.min_bytes = int(os.environ.get('ES_BULK_MIN_BYTES', 256 * 1024))
+        self.max_retries = int(os.environ.get('ES_BULK_MAX_RETRIES', 5))
+        self.timeout = aiohttp.ClientTimeout(total=int(os.environ.get('ES_BULK_TIMEOUT', 30)))
+        self.task_poll_interval = float(os.environ.get('ES_TASK_POLL_INTERVAL', 1))
+        self.bulk_bytes = self.max_bytes
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+                headers={'Content-Type': 'application/x-ndjson'},
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    def _shrink(self):
+        self.bulk_bytes = max(self.bulk_bytes // 2, self.min_bytes)
+        logging.info(f'ES BULK: throttled, bulk size is {self.bulk_bytes} bytes')
+
+    def _grow(self):
+        self.bulk_bytes = min(int(self.bulk_bytes * 1.25), self.max_bytes)
+
+    def _chunks(self, items):
+        chunk, size = [], 0
+        for item in items:
+            if chunk and size + len(item[1]) > self.bulk_bytes:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(item)
+            size += len(item[1])
+        if chunk:
+            yield chunk
+
+    async def _post(self, chunk, failed, params):
+        async with self.semaphore:
+            t1 = time.perf_counter()
+            async with self._get_session().post(
+                self.url, data=b''.join(item[1] for item in chunk), params=params,
+            ) as resp:
+                metrics.BULK_DOCUMENTS.inc(len(chunk))
+                if resp.status == HTTPStatus.TOO_MANY_REQUESTS:
+                    metrics.REJECTED.labels(resp.status).inc(len(chunk))
+                    self._shrink()
+                    return chunk
+                resp.raise_for_status()
+                result = await resp.json()
+            metrics.BULK_SECONDS.observe(time.perf_counter() - t1)
+
+        rejected = []
+        throttled = False
+        for item, res in zip(chunk, result['items']):
+            ((operation, op_result),) = res.items()
+            status = op_result['status']
+            if not result['errors']:
+                continue
+            if operation == 'delete' and status == HTTPStatus.NOT_FOUND:
+                continue
+            if status >= HTTPStatus.MULTIPLE_CHOICES:
+                metrics.REJECTED.labels(status).inc()
+            if status in RETRY_STATUSES:
+                throttled = throttled or status == HTTPStatus.TOO_MANY_REQUESTS
+                rejected.append(item)
+            elif status >= HTTPStatus.MULTIPLE_CHOICES:
+                failed.append(item[0])
+                logging.warning(f'ES BULK: document {op_result["_id"]} is rejected: {op_result.get("error")}')
+        if throttled:
+            self._shrink()
+        elif not result['errors']:
+            self._grow()
+        return rejected
+
+    async def bulk(self, items, refresh=False) -> list[str]:
+        # Returns the ids of the documents rejected for good (mapping errors and the like), those are
+        # not retried. With refresh the call returns once the changes are visible to searches.
+        failed = []
+        params = {'refresh': 'wait_for'} if refresh else None
+        for attempt in range(self.max_retries):
+            results = await asyncio.gather(*(self._post(chunk, failed, params) for chunk in self._chunks(items)))
+            items = [item for rejected in results for item in rejected]
+            if not items:
+                return failed
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 10))
+        raise BulkError([item[0] for item in items])
+
+    @staticmethod
+    def _source(value) -> bytes:
+        # documents already serialized by the transformers or by Postgres are sent as they are
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode()
+        return json.dumps(value).encode()
+
+    async def _request(self, method: str, path: str, body: dict | None = None, params=None) -> dict:
+        async with self.semaphore:
+            async with self._get_session().request(
+                method,
+                f'{self.base_url}/{path}',
+                data=json.dumps(body) if body is not None else None,
+                params=params,
+                headers={'Content-Type': 'application/json'},
+            ) as resp:
+                resp.raise_for_status()
+                return await resp.json()
+
+    async def mget(self, index: str, ids: list[str], fields: list[str]) -> dict:
+        result = await self._request('POST', f'{index}/_mget', {'ids': ids}, {'_source_includes': ','.join(fields)})
+        return {doc['_id']: doc['_source'] for doc in result['docs'] if doc.get('found')}
+
+    async def search(self, index: str, body: dict) -> dict:
+        return await self._request('POST', f'{index}/_search', body)
 
     @backoff()
-    async def start(self, lock, data):
-        to_request = '\n'
-        for key, value in data.items():
-            to_request += json.dumps({'index': {'_index': self.index, '_id': key}}) + '\n'
-            to_request += json.dumps(value) + '\n'
-
-        await lock.acquire()
-        try:
-            headers = {'Content-Type': 'application/x-ndjson'}
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    f'http://{self.host}:{self.port}/_bulk',
-                    headers=headers,
-                    data=to_request,
-                ) as resp:
-                    resp.raise_for_status()
-        finally:
-            lock.release()
-
-class LoaderPersons:
-    def __init__(self, host: str, port: int, index: str):
-        self.host = host
-        self.port = port
+    async def _task(self, task_id: str) -> dict:
+        return await self._request('GET', f'_tasks/{task_id}')
+
+    async def _wait(self, task_id: str) -> dict:
+        # A query over many documents outlasts the request timeout. It runs as a task and only the
+        # polls are retried, a retried request would start another task over the same documents.
+        while not (task := await self._task(task_id))['completed']:
+            await asyncio.sleep(self.task_poll_interval)
+        if 'error' in task:
+            raise UpdateTaskError(f'task {task_id}: {task["error"]}')
+        result = task['response']
+        if result.get('failures'):
+            raise UpdateTaskError(f'task {task_id}: {len(result["failures"])} documents are not updated')
+        return result
+
+    async def update_by_query(self, index: str, query: dict, script: dict) -> int:
+        # Documents reindexed while the query runs are version conflicts. Nothing rebuilds them with the
+        # patched value later, so the query is repeated until it gets through, the scripts are idempotent.
+        updated = 0
+        for attempt in range(self.max_retries):
+            started = await self._request(
+                'POST',
+                f'{index}/_update_by_query',
+                {'query': query, 'script': script},
+                {'conflicts': 'proceed', 'slices': 'auto', 'wait_for_completion': 'false'},
+            )
+            result = await self._wait(started['task'])
+            updated += result['updated']
+            if not result['version_conflicts']:
+                return updated
+            logging.info(f'ES UPDATE {index}: {result["version_conflicts"]} version conflicts, retrying')
+            await asyncio.sleep(min(0.1 * 2 ** attempt, 10))
+        raise UpdateConflictError(f'{index}: update by query keeps conflicting with concurrent writes')
+
+    async def index(self, index: str, data: dict, refresh=False) -> list[str]:
+        items = [
+            (
+                key,
+                json.dumps({'index': {'_index': index, '_id': key}}).encode() + b'\n' + self._source(value) + b'\n',
+            )
+            for key, value in data.items()
+        ]
+        return await self.bulk(items, refresh)
+
+    async def delete(self, index: str, ids: list[str], refresh=False):
+        items = [(key, json.dumps({'delete': {'_index': index, '_id': key}}).encode() + b'\n') for key in ids]
+        await self.bulk(items, refresh)
+
+
+class Loader:
+    def __init__(self, engine: BulkEngine, index: str, fingerprints=None, invalidator=None):
+        self.engine = engine
         self.index = index
+        self.fingerprints = fingerprints
+        self.invalidator = invalidator
+
+    @backoff()
+    async def start(self, data):
+        # Documents whose fingerprint is unchanged since the last successful load are not sent
+        if self.fingerprints is not None:
+            data = await self.fingerprints.start(data)
+        if data:
+            # the API cache is evicted once searches see the changes, not before
+            failed = set(await self.engine.index(self.index, data, refresh=self.invalidator is not None))
+            # rejected documents get no fingerprint, the next load sends them again instead of skipping them
+            loaded = {key: value for key, value in data.items() if key not in failed}
+            if self.fingerprints is not None:
+                self.fingerprints.save(loaded)
+            if self.invalidator is not None:
+                self.invalidator.invalidate(self.index, list(loaded))
 
     @backoff()
-    async def start(self, lock: asyncio.Lock, data) -> None:
-        to_request = '\n'
-        for key, value in data.items():
-            to_request += json.dumps({'index': {'_index': self.index, '_id': key}}) + '\n'
-            to_request += json.dumps(value) + '\n'
-
-        await lock.acquire()
-        try:
-            headers = {'Content-Type': 'application/x-ndjson'}
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    f'http://{self.host}:{self.port}/_bulk',
-                    headers=headers,
-                    data=to_request,
-                ) as resp:
-                    resp.raise_for_status()
-        finally:
-            lock.release()
-
-class LoaderGenres:
-    def __init__(self, host: str, port: int, index: str):
-        self.host = host
-        self.port = port
+    async def delete(self, ids):
+        if ids:
+            await self.engine.delete(self.index, ids, refresh=self.invalidator is not None)
+            if self.fingerprints is not None:
+                self.fingerprints.forget(ids)
+            if self.invalidator is not None:
+                self.invalidator.invalidate(self.index, ids)
+
+
+PERSON_RENAME = '''
+boolean changed = false;
+for (String role : params.roles) {
+    List persons = ctx._source[role];
+    List names = ctx._source[role + '_names'];
+    if (persons == null) {
+        continue;
+    }
+    for (int i = 0; i < persons.size(); i++) {
+        String name = params.names[persons[i].id];
+        if (name != null && name != persons[i].name) {
+            persons[i].name = name;
+            if (names != null && i < names.size()) {
+                names[i] = name;
+            }
+            changed = true;
+        }
+    }
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+'''
+
+GENRE_RENAME = '''
+boolean changed = false;
+List genres = ctx._source.genres;
+if (genres != null) {
+    for (int i = 0; i < genres.size(); i++) {
+        String name = params.names[genres[i].id];
+        if (name != null && name != genres[i].name) {
+            genres[i].name = name;
+            changed = true;
+        }
+    }
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+'''
+
+
+class Renames:
+    # Pipeline stage in front of the genres/persons loader. A renamed person or genre is patched into
+    # the movies documents in place by a script, instead of rebuilding every film it belongs to.
+    ROLES = ('actors', 'writers', 'directors')
+
+    def __init__(self, engine: BulkEngine, index: str, target: str = 'movies'):
+        self.engine = engine
         self.index = index
+        self.target = target
+
+    @staticmethod
+    def _name(document):
+        if isinstance(document, (bytes, str)):
+            document = json.loads(document)
+        return document['name']
+
+    def _update(self, renames: dict):
+        if self.index == 'persons':
+            query = {
+                'bool': {
+                    'should': [
+                        {'nested': {'path': role, 'query': {'terms': {f'{role}.id': list(renames)}}}}
+                        for role in self.ROLES
+                    ],
+                },
+            }
+            params = {'roles': list(self.ROLES), 'names': renames}
+            return query, {'source': PERSON_RENAME, 'lang': 'painless', 'params': params}
+        query = {'nested': {'path': 'genres', 'query': {'terms': {'genres.id': list(renames)}}}}
+        return query, {'source': GENRE_RENAME, 'lang': 'painless', 'params': {'names': renames}}
 
     @backoff()
-    async def start(self, lock, data):
-        to_request = '\n'
-        for key, value in data.items():
-            to_request += json.dumps({'index': {'_index': self.index, '_id': key}}) + '\n'
-            to_request += json.dumps(value) + '\n'
-
-        await lock.acquire()
-        try:
-            headers = {'Content-Type': 'application/x-ndjson'}
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(
-                    f'http://{self.host}:{self.port}/_bulk',
-                    headers=headers,
-                    data=to_request,
-                ) as resp:
-                    resp.raise_for_status()
-        finally:
-            lock.release()
+    async def start(self, data):
+        if not data:
+            return data
+        old = await self.engine.mget(self.index, list(data), ['name'])
+        renames = {}
+        for key, document in data.items():
+            name = self._name(document)
+            if key in old and old[key].get('name') != name:
+                renames[key] = name
+        if renames:
+            updated = await self.engine.update_by_query(self.target, *self._update(renames))
+            logging.info(f'RENAMES {self.index}: {len(renames)} renamed, {updated} {self.target} documents patched')
+        return data
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+
+class Fingerprints:
+    def __init__(self, redis_adapter, index: str, force: bool = False):
+        # with force every document is sent, fingerprints are only stored for the next runs
+        self.redis_adapter = redis_adapter
+        self.index = index
+        self.force = force
+        self.key = f'fingerprints:{index}'
+        self.checked = 0
+        self.skipped = 0
+
+    @staticmethod
+    def fingerprint(doc) -> str:
+        if isinstance(doc, bytes):
+            data = doc
+        elif isinstance(doc, str):
+            data = doc.encode()
+        else:
+            data = json.dumps(doc, sort_keys=True, separators=(',', ':'), default=str).encode()
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+    async def start(self, data: dict) -> dict:
+        if not data or self.force:
+            return data
+        keys = list(data.keys())
+        stored = self.redis_adapter.hmget(self.key, keys)
+        changed = {
+            key: data[key]
+            for key, fingerprint in zip(keys, stored)
+            if fingerprint != self.fingerprint(data[key])
+        }
+        skipped = len(data) - len(changed)
+        self.checked += len(data)
+        self.skipped += skipped
+        if skipped:
+            logging.info(f'FINGERPRINTS {self.index}: {skipped} of {len(data)} documents are unchanged')
+        return changed
+
+    def save(self, data: dict):
+        if data:
+            self.redis_adapter.hset(self.key, mapping={key: self.fingerprint(value) for key, value in data.items()})
+
+    def forget(self, ids):
+        if ids:
+            self.redis_adapter.hdel(self.key, *ids)
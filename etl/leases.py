@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+import zlib
+from functools import partial
+
+logging.basicConfig(level=logging.INFO)
+
+RENEW = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+'''
+
+RELEASE = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+def shard_of(key: str, shards: int) -> int:
+    return zlib.crc32(str(key).encode()) % shards
+
+
+class Leases:
+    def __init__(self, redis_adapter, prefix='lease', ttl=None, heartbeat=None):
+        self.redis_adapter = redis_adapter
+        self.prefix = prefix
+        self.ttl = float(ttl or os.environ.get('ETL_LEASE_TTL', 30))
+        self.heartbeat = float(heartbeat or os.environ.get('ETL_LEASE_HEARTBEAT', self.ttl / 3))
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._renew = redis_adapter.register_script(RENEW)
+        self._release = redis_adapter.register_script(RELEASE)
+
+    def _key(self, name: str) -> str:
+        return f'{self.prefix}:{name}'
+
+    def acquire(self, name: str) -> bool:
+        return bool(self.redis_adapter.set(self._key(name), self.owner, nx=True, px=int(self.ttl * 1000)))
+
+    def renew(self, name: str) -> bool:
+        return bool(self._renew(keys=[self._key(name)], args=[self.owner, int(self.ttl * 1000)]))
+
+    def release(self, name: str):
+        self._release(keys=[self._key(name)], args=[self.owner])
+
+    async def run(self, name: str, work) -> bool:
+        # Runs work() only while this worker holds the lease. The lease is renewed every heartbeat,
+        # a lease that expired (the worker stalled or crashed) can be taken by another worker,
+        # and the work that lost its lease is cancelled. Returns False if the lease is taken.
+        if not self.acquire(name):
+            return False
+        task = asyncio.create_task(work())
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.heartbeat)
+                if not task.done() and not self.renew(name):
+                    logging.warning(f'LEASE {name}: lost by {self.owner}, work is stopped')
+                    task.cancel()
+            result, = await asyncio.gather(task, return_exceptions=True)
+            if isinstance(result, Exception):
+                logging.error(f'LEASE {name}: work failed: {result!r}')
+        finally:
+            if not task.done():
+                task.cancel()
+            self.release(name)
+        return True
+
+
+class Shards:
+    def __init__(self, leases: Leases, count=None):
+        self.leases = leases
+        self.count = int(count or os.environ.get('ETL_SHARDS', 1))
+
+    def name(self, name: str, shard: int) -> str:
+        return name if self.count == 1 else f'{name}:{shard}'
+
+    async def run(self, name: str, work):
+        # work(shard_name, shard) for every shard of name that is not leased by another worker.
+        # Workers walk the shards in random order, so they rarely race for the same one.
+        for shard in random.sample(range(self.count), self.count):
+            shard_name = self.name(name, shard)
+            if not await self.leases.run(shard_name, partial(work, shard_name, shard)):
+                logging.info(f'LEASE {shard_name}: held by another worker')
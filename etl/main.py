@@ -1,109 +1,526 @@
+import argparse
 import asyncio
 import datetime
 import logging
 import os
+import sys
 import time
+import uuid
 from datetime import timezone
+from functools import partial
 
+import metrics
+from cache_invalidation import CacheInvalidator
+from dirty_set import DirtySet
 from dotenv import load_dotenv
-from es_loaders import LoaderGenres, LoaderMovies, LoaderPersons
-from pg_extractors import ExtractorGenres, ExtractorMovies, ExtractorPersons
+from es_loaders import BulkEngine, Loader, Renames
+from fingerprints import Fingerprints
+from leases import Leases, Shards
+from outbox import OutboxConsumer, OutboxListener
+from pg_extractors import (ChangeCollector, ExtractorGenres,
+                           ExtractorGenresByIds, ExtractorMovies,
+                           ExtractorMoviesFull, ExtractorMoviesFullJson,
+                           ExtractorMoviesJson, ExtractorPersons,
+                           ExtractorPersonsByIds)
+from pg_pool import PostgresPool
+from pipeline import Pipeline
+from reconcile import Reconciler
 from redis import Redis
-from setup import setup
+from setup import create_shadow, finish_shadow, setup, swap_alias
+from state import State
 from transformers import (TransformerGenres, TransformerMovies,
-                          TransformerPersons)
+                          TransformerMoviesJson, TransformerPersons)
+from windows import window_controller
 
 logging.basicConfig(level=logging.INFO)
 
+START_TIME = datetime.datetime(2024, 1, 1, tzinfo=timezone.utc)
+INDEXES = {
+    'movies': 'es_config/movies.json',
+    'persons': 'es_config/persons.json',
+    'genres': 'es_config/genres.json',
+}
 
-async def ETL_process(process_name, redis_adapter, lock_postgres, lock_elastic, extructor, transformer, loader):
-    TIME_DELTA = os.environ.get('TIME_DELTA')
 
-    current_time = datetime.datetime.now().astimezone(datetime.timezone.utc)
-    delta = datetime.timedelta(hours=int(TIME_DELTA))
+def movies_classes():
+    # MOVIES_DOCUMENTS=postgres builds movie documents with JSON aggregation in Postgres,
+    # the rows are sent to Elasticsearch without building dicts in Python
+    if os.environ.get('MOVIES_DOCUMENTS', 'python') == 'postgres':
+        return ExtractorMoviesJson, ExtractorMoviesFullJson, TransformerMoviesJson
+    return ExtractorMovies, ExtractorMoviesFull, TransformerMovies
 
-    if redis_adapter.get(process_name) is None:
-        redis_adapter.set(process_name, str(datetime.datetime(2024, 1, 1, tzinfo=timezone.utc)))
 
-    while datetime.datetime.fromisoformat(redis_adapter.get(process_name)) < current_time:
-        curr_delta = min(delta, current_time - datetime.datetime.fromisoformat(redis_adapter.get(process_name)))
-        async for data in extructor.start(redis_adapter, lock_postgres, curr_delta):
-            data = await transformer.start(data)
-            await loader.start(lock_elastic, data)
+def etl_pipeline(name, transformer, loader, load_workers=None, renames=False):
+    stages = [(transformer, int(os.environ.get('PIPELINE_TRANSFORM_WORKERS', 1)))]
+    if renames:
+        stages.append((Renames(loader.engine, loader.index), 1))
+    stages.append((loader, load_workers or int(os.environ.get('PIPELINE_LOAD_WORKERS', 2))))
+    return Pipeline(name, stages)
+
+
+async def ETL_process(process_name, state, lock_postgres, extructor, pipeline, till_time=None, delta=None):
+    # windows are sized adaptively unless a fixed delta is given
+    current_time = till_time or datetime.datetime.now().astimezone(datetime.timezone.utc)
+    controller = window_controller(process_name) if delta is None else None
+
+    if not state.get(process_name).get('window'):
+        state.set(process_name, {'window': START_TIME})
+
+    while (from_time := datetime.datetime.fromisoformat(state.get(process_name)['window'])) < current_time:
+        remaining = current_time - from_time
+        curr_delta = controller.next(remaining) if controller is not None else min(delta, remaining)
+        rows = pipeline.source_stats.rows
+        t1 = time.perf_counter()
+        try:
+            await pipeline.run(extructor.start(lock_postgres, curr_delta))
+        except Exception:
+            # progress is stored up to the last loaded batch, the rest is retried next cycle
+            logging.exception(f'{process_name.upper()}: synchronization is stopped')
+            break
+        if controller is not None:
+            controller.observe(curr_delta, pipeline.source_stats.rows - rows, time.perf_counter() - t1)
+    pipeline.log_stats()
+
+
+async def dirty_process(lock_postgres, extructor, pipeline):
+    try:
+        await pipeline.run(extructor.start(lock_postgres))
+    except Exception:
+        logging.exception(f'{extructor.proccess_name.upper()}: synchronization is stopped')
+    pipeline.log_stats()
+
+
+async def movies_process(
+    redis_adapter, state, shards, lock_postgres, pool, loader, dirty_key='movies:dirty', partial_updates=False,
+):
+    dirty_set = DirtySet(redis_adapter, dirty_key, shards.count)
+    extructor, _, transformer = movies_classes()
+
+    async def collect(process_name, shard_name, shard):
+        await ETL_process(
+            shard_name,
+            state,
+            lock_postgres,
+            ChangeCollector(pool, shard_name, state, shard=shard, shards=shards.count),
+            Pipeline(shard_name, [(dirty_set, 1)]),
+        )
+
+    # with partial updates renamed genres and persons are patched by their own pipelines
+    collectors = ('movies_film_work',) if partial_updates else ('movies_genre', 'movies_film_work', 'movies_person')
+    await asyncio.gather(
+        *(shards.run(process_name, partial(collect, process_name)) for process_name in collectors),
+    )
+    await dirty_shards(
+        shards, 'movies', lock_postgres, dirty_set,
+        partial(extructor, pool, remover=loader.delete),
+        etl_pipeline('movies', transformer(), loader),
+    )
+
+
+async def dirty_shards(shards, name, lock_postgres, dirty_set, extructor, pipeline):
+    async def work(shard_name, shard):
+        await dirty_process(lock_postgres, extructor(dirty_set=dirty_set.part(shard)), pipeline)
+
+    await shards.run(f'{name}:dirty', work)
+
+
+async def in_order(movies, renames, partial_updates):
+    # With partial updates a renamed genre or person is patched into the movies documents that
+    # are already indexed, nothing rebuilds those films later. A film loaded after the patch
+    # from rows read before the rename would keep the old name, so the movies stages of a cycle
+    # finish before the stages that patch renames start.
+    if partial_updates:
+        await asyncio.gather(*movies)
+        await asyncio.gather(*renames)
+    else:
+        await asyncio.gather(*movies, *renames)
+
+
+async def outbox_process(redis_adapter, state, shards, locks, pool, loaders, partial_updates=False):
+    lp_movies, lp_genre, lp_person = locks
+    movies = DirtySet(redis_adapter, 'movies:dirty', shards.count)
+    genres = DirtySet(redis_adapter, 'genres:dirty', shards.count)
+    persons = DirtySet(redis_adapter, 'persons:dirty', shards.count)
+    extructor, _, transformer = movies_classes()
+
+    # the outbox is read in sequence order by one worker at a time, the dirty sets it fills are sharded
+    await shards.leases.run(
+        'outbox', partial(OutboxConsumer(pool, state, movies, genres, persons, fan_out=not partial_updates).start, lp_movies),
+    )
+    await in_order(
+        [
+            dirty_shards(
+                shards, 'movies', lp_movies, movies,
+                partial(extructor, pool, remover=loaders['movies'].delete),
+                etl_pipeline('movies', transformer(), loaders['movies']),
+            ),
+        ],
+        [
+            dirty_shards(
+                shards, 'genres', lp_genre, genres,
+                partial(ExtractorGenresByIds, pool, 'genres', remover=loaders['genres'].delete),
+                etl_pipeline('genres', TransformerGenres(), loaders['genres'], renames=partial_updates),
+            ),
+            dirty_shards(
+                shards, 'persons', lp_person, persons,
+                partial(ExtractorPersonsByIds, pool, 'persons', remover=loaders['persons'].delete),
+                etl_pipeline('persons', TransformerPersons(), loaders['persons'], renames=partial_updates),
+            ),
+        ],
+        partial_updates,
+    )
+
+
+async def film_persons_process(
+    redis_adapter, state, shards, lock_postgres, pool, loader, dirty_key, partial_updates=False,
+):
+    # persons documents carry their filmography, persons of changed films are rebuilt by id
+    dirty_set = DirtySet(redis_adapter, dirty_key, shards.count)
+
+    async def collect(shard_name, shard):
+        await ETL_process(
+            shard_name,
+            state,
+            lock_postgres,
+            ChangeCollector(pool, shard_name, state, shard=shard, shards=shards.count),
+            Pipeline(shard_name, [(dirty_set, 1)]),
+        )
+
+    await shards.run('persons_film_work', collect)
+    await dirty_shards(
+        shards, 'persons', lock_postgres, dirty_set,
+        partial(ExtractorPersonsByIds, pool, 'persons', remover=loader.delete),
+        etl_pipeline('persons', TransformerPersons(), loader, renames=partial_updates),
+    )
+
+
+async def modified_process(
+    redis_adapter, state, shards, locks, pool, loaders, dirty_prefix='', partial_updates=False,
+):
+    lp_movies, lp_genre, lp_person = locks
+    processes, renames = [], []
+    if 'movies' in loaders:
+        processes.append(
+            movies_process(
+                redis_adapter, state, shards, lp_movies, pool, loaders['movies'], f'{dirty_prefix}movies:dirty',
+                partial_updates,
+            ),
+        )
+    if 'persons' in loaders:
+        # A person renamed in the cycle may be reloaded here first, for a changed film, and the
+        # pipelines after it would see the new name as the old one. So every pipeline that writes
+        # persons patches renames and runs in the stage after the movies.
+        renames.append(
+            film_persons_process(
+                redis_adapter, state, shards, lp_person, pool, loaders['persons'], f'{dirty_prefix}persons:dirty',
+                partial_updates,
+            ),
+        )
+    if 'genres' in loaders:
+        # genres are found by modified time, the dirty set holds the ones the reconciliation found
+        renames.append(
+            dirty_shards(
+                shards, 'genres', lp_genre, DirtySet(redis_adapter, f'{dirty_prefix}genres:dirty', shards.count),
+                partial(ExtractorGenresByIds, pool, 'genres', remover=loaders['genres'].delete),
+                etl_pipeline('genres', TransformerGenres(), loaders['genres'], renames=partial_updates),
+            ),
+        )
+    for index, process_name, lock, extructor, transformer in (
+        ('genres', 'genre', lp_genre, ExtractorGenres, TransformerGenres),
+        ('persons', 'person', lp_person, ExtractorPersons, TransformerPersons),
+    ):
+        if index not in loaders:
+            continue
+        pipeline = etl_pipeline(process_name, transformer(), loaders[index], renames=partial_updates)
+
+        async def work(shard_name, shard, lock=lock, extructor=extructor, pipeline=pipeline):
+            await ETL_process(
+                shard_name,
+                state,
+                lock,
+                extructor(pool, proccess_name=shard_name, state=state, shard=shard, shards=shards.count),
+                pipeline,
+            )
+
+        renames.append(shards.run(process_name, work))
+    await in_order(processes, renames, partial_updates)
+
+
+async def full_process(state, pool, loaders, till_time, load_workers):
+    # Every document from scratch in one keyset pass per index, indexes are loaded in parallel
+    _, movies_extructor, movies_transformer = movies_classes()
+    extructors = {
+        'movies': (movies_extructor, movies_transformer),
+        'genres': (ExtractorGenres, TransformerGenres),
+        'persons': (ExtractorPersons, TransformerPersons),
+    }
+    processes = []
+    for index, loader in loaders.items():
+        extructor, transformer = extructors[index]
+        processes.append(
+            ETL_process(
+                index,
+                state,
+                asyncio.Lock(),
+                extructor(pool, proccess_name=index, state=state),
+                etl_pipeline(index, transformer(), loader, load_workers),
+                till_time=till_time,
+                delta=till_time - START_TIME,
+            ),
+        )
+    await asyncio.gather(*processes)
+
+
+async def rebuild(dsn, indexes):
+    # Builds new versions of the indexes next to the live ones and swaps the aliases the API reads.
+    # Changes made while the new indexes are built are caught up by modified time before and after
+    # the swap, progress of the incremental ETL is not touched.
+    REDIS_HOST = os.environ.get('REDIS_HOST')
+    REDIS_PORT = os.environ.get('REDIS_PORT')
+    ELASTIC_HOST = os.environ.get('ELASTIC_HOST')
+    ELASTIC_PORT = os.environ.get('ELASTIC_PORT')
+    LOAD_WORKERS = int(os.environ.get('REBUILD_LOAD_WORKERS', 4))
+
+    redis_adapter = Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    state = State(redis_adapter, key='etl:rebuild')
+    dirty_prefix = 'rebuild:'
+    for key in ('movies:dirty', 'genres:dirty', 'persons:dirty'):
+        redis_adapter.delete(f'{dirty_prefix}{key}', f'{dirty_prefix}{key}:processing')
+    redis_adapter.delete(state.key)
+    shards = Shards(Leases(redis_adapter, prefix='lease:rebuild'), count=1)
+    locks = (asyncio.Lock(), asyncio.Lock(), asyncio.Lock())
+    pool = PostgresPool(dsn)
+    await pool.open()
+    engine = BulkEngine(host=ELASTIC_HOST, port=ELASTIC_PORT, concurrency=LOAD_WORKERS)
+
+    try:
+        shadows = {index: create_shadow(ELASTIC_HOST, ELASTIC_PORT, index, INDEXES[index]) for index in indexes}
+        loaders = {
+            index: Loader(engine, index=name, fingerprints=Fingerprints(redis_adapter, name))
+            for index, (name, _) in shadows.items()
+        }
+
+        started = datetime.datetime.now().astimezone(datetime.timezone.utc)
+        for process_name in (
+            'movies_genre', 'movies_film_work', 'movies_person', 'persons_film_work', 'genre', 'person',
+        ):
+            state.set(process_name, {'window': started})
+        await full_process(state, pool, loaders, started, LOAD_WORKERS)
+        for index in indexes:
+            if datetime.datetime.fromisoformat(state.get(index)['window']) < started:
+                raise RuntimeError(f'REBUILD: {index} is not loaded completely, aliases are not changed')
+        await modified_process(redis_adapter, state, shards, locks, pool, loaders, dirty_prefix)
+
+        for index, (name, live_settings) in shadows.items():
+            finish_shadow(ELASTIC_HOST, ELASTIC_PORT, name, live_settings)
+            swap_alias(ELASTIC_HOST, ELASTIC_PORT, index, name)
+            if redis_adapter.exists(loaders[index].fingerprints.key):
+                redis_adapter.rename(loaders[index].fingerprints.key, f'fingerprints:{index}')
+            else:
+                redis_adapter.delete(f'fingerprints:{index}')
+
+        invalidator = CacheInvalidator(redis_adapter)
+        loaders = {
+            index: Loader(engine, index=index, fingerprints=Fingerprints(redis_adapter, index), invalidator=invalidator)
+            for index in indexes
+        }
+        await modified_process(redis_adapter, state, shards, locks, pool, loaders, dirty_prefix)
+        redis_adapter.delete(state.key)
+    finally:
+        await engine.close()
+        await pool.close()
+
+
+async def reconcile(dsn, indexes):
+    # Compares the indexes with Postgres and marks the documents that differ dirty,
+    # the running ETL reloads them on its next cycle
+    REDIS_HOST = os.environ.get('REDIS_HOST')
+    REDIS_PORT = os.environ.get('REDIS_PORT')
+    ELASTIC_HOST = os.environ.get('ELASTIC_HOST')
+    ELASTIC_PORT = os.environ.get('ELASTIC_PORT')
+
+    redis_adapter = Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    shards = Shards(Leases(redis_adapter))
+    pool = PostgresPool(dsn)
+    await pool.open()
+    engine = BulkEngine(host=ELASTIC_HOST, port=ELASTIC_PORT)
+    try:
+        await asyncio.gather(
+            *(
+                Reconciler(
+                    pool, engine, index, DirtySet(redis_adapter, f'{index}:dirty', shards.count),
+                    Fingerprints(redis_adapter, index),
+                ).start()
+                for index in indexes
+            ),
+        )
+    finally:
+        await engine.close()
+        await pool.close()
+
+
+async def backfill(dsn, index, ids=None, since=None, till=None, concurrency=None):
+    # Reloads the given ids or the rows modified in [since, till) of one index with the ETL's own
+    # extractors, transformers and loaders. Work is split into `concurrency` parts that run in parallel;
+    # progress is kept under keys of this run only, the checkpoints of the running ETL are not touched.
+    REDIS_HOST = os.environ.get('REDIS_HOST')
+    REDIS_PORT = os.environ.get('REDIS_PORT')
+    ELASTIC_HOST = os.environ.get('ELASTIC_HOST')
+    ELASTIC_PORT = os.environ.get('ELASTIC_PORT')
+    concurrency = int(concurrency or os.environ.get('BACKFILL_CONCURRENCY', 4))
+    # reloaded genres and persons patch the movies they are renamed in, as the running ETL does
+    renames = index != 'movies' and os.environ.get('ES_PARTIAL_UPDATES', 'true').lower() == 'true'
+
+    run = uuid.uuid4().hex[:8]
+    redis_adapter = Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    state = State(redis_adapter, key=f'etl:backfill:{run}')
+    pool = PostgresPool(dsn)
+    await pool.open()
+    engine = BulkEngine(host=ELASTIC_HOST, port=ELASTIC_PORT, concurrency=concurrency)
+    loader = Loader(
+        engine,
+        index=index,
+        fingerprints=Fingerprints(redis_adapter, index, force=True),
+        invalidator=CacheInvalidator(redis_adapter),
+    )
+    movies_by_ids, movies_keyset, movies_transformer = movies_classes()
+    by_ids, keyset, transformer = {
+        'movies': (partial(movies_by_ids, pool), movies_keyset, movies_transformer),
+        'genres': (partial(ExtractorGenresByIds, pool, 'genres'), ExtractorGenres, TransformerGenres),
+        'persons': (partial(ExtractorPersonsByIds, pool, 'persons'), ExtractorPersons, TransformerPersons),
+    }[index]
+    dirty_set = DirtySet(redis_adapter, f'backfill:{run}:{index}:dirty', concurrency)
+
+    async def load_ids(shard):
+        part = dirty_set.part(shard)
+        try:
+            await dirty_process(
+                asyncio.Lock(),
+                by_ids(dirty_set=part, remover=loader.delete),
+                etl_pipeline(f'backfill {index}', transformer(), loader, renames=renames),
+            )
+        finally:
+            redis_adapter.delete(part.key, part.processing_key)
+
+    async def load_range(shard):
+        process_name = f'{index}:{shard}'
+        state.set(process_name, {'window': since})
+        await ETL_process(
+            process_name,
+            state,
+            asyncio.Lock(),
+            keyset(pool, proccess_name=process_name, state=state, shard=shard, shards=concurrency),
+            etl_pipeline(f'backfill {index}', transformer(), loader, renames=renames),
+            till_time=till,
+            delta=till - since,
+        )
+
+    try:
+        if ids:
+            await dirty_set.start(ids)
+            await asyncio.gather(*(load_ids(shard) for shard in range(concurrency)))
+        else:
+            await asyncio.gather(*(load_range(shard) for shard in range(concurrency)))
+    finally:
+        redis_adapter.delete(state.key)
+        await engine.close()
+        await pool.close()
+
+
+def backfill_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py backfill')
+    parser.add_argument('index', choices=list(INDEXES))
+    # ids and a time range are not combined, a run reloads either of them
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--ids', nargs='+', type=uuid.UUID, help='ids to reload')
+    source.add_argument('--file', help='file with one id per line')
+    source.add_argument('--since', type=datetime.datetime.fromisoformat, help='reload rows modified since')
+    parser.add_argument('--till', type=datetime.datetime.fromisoformat, help='reload rows modified before')
+    parser.add_argument('--concurrency', type=int)
+    args = parser.parse_args(argv)
+
+    if args.till is not None and args.since is None:
+        parser.error('--till requires --since')
+    ids = [str(item) for item in args.ids or []]
+    if args.file:
+        bad = []
+        with open(args.file) as f:
+            for line in filter(None, map(str.strip, f)):
+                try:
+                    ids.append(str(uuid.UUID(line)))
+                except ValueError:
+                    bad.append(line)
+        if bad:
+            parser.error(f'{args.file}: {len(bad)} lines are not ids: {", ".join(bad[:10])}')
+    since, till = (
+        item if item is None or item.tzinfo else item.replace(tzinfo=timezone.utc)
+        for item in (args.since, args.till or datetime.datetime.now(timezone.utc))
+    )
+    return {'index': args.index, 'ids': ids, 'since': since, 'till': till, 'concurrency': args.concurrency}
 
 
 async def main(dsn):
     lp_movies = asyncio.Lock()
-    le_movies = asyncio.Lock()
     lp_genre = asyncio.Lock()
-    le_genre = asyncio.Lock()
     lp_person = asyncio.Lock()
-    le_person = asyncio.Lock()
 
     TIME_SYNC = os.environ.get('TIME_SYNC')
+    CHANGE_SOURCE = os.environ.get('CHANGE_SOURCE', 'modified')
+    SKIP_UNCHANGED = os.environ.get('ES_SKIP_UNCHANGED', 'true').lower() == 'true'
+    INVALIDATE_CACHE = os.environ.get('API_CACHE_INVALIDATION', 'true').lower() == 'true'
+    PARTIAL_UPDATES = os.environ.get('ES_PARTIAL_UPDATES', 'true').lower() == 'true'
     REDIS_HOST = os.environ.get('REDIS_HOST')
     REDIS_PORT = os.environ.get('REDIS_PORT')
     ELASTIC_HOST = os.environ.get('ELASTIC_HOST')
     ELASTIC_PORT = os.environ.get('ELASTIC_PORT')
 
     redis_adapter = Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    state = State(redis_adapter)
+    # every process works only on the shards it holds a lease on, so several processes share the load
+    shards = Shards(Leases(redis_adapter))
+    pool = PostgresPool(dsn)
+    await pool.open()
+    engine = BulkEngine(host=ELASTIC_HOST, port=ELASTIC_PORT)
+    # loaded documents evict the API responses they are in, the API shares this Redis
+    invalidator = CacheInvalidator(redis_adapter) if INVALIDATE_CACHE else None
+    loaders = {
+        index: Loader(
+            engine,
+            index=index,
+            fingerprints=Fingerprints(redis_adapter, index) if SKIP_UNCHANGED else None,
+            invalidator=invalidator,
+        )
+        for index in ('movies', 'genres', 'persons')
+    }
+    listener = OutboxListener(dsn) if CHANGE_SOURCE == 'outbox' else None
+    metrics.start()
 
-    # TODO: make that data was loaded by different processes only once
-    # NOTE: if you delete data in elastic - dont forget to delete progress in Redis
+    # NOTE: if you delete data in elastic - dont forget to delete progress in Redis (etl:checkpoints),
+    # single documents or periods are reloaded with python main.py backfill
 
     while True:
         t1 = time.perf_counter()
-        await asyncio.gather(
-            *(
-                ETL_process(process_name, redis_adapter, lp, le, ext, trm, ldr)
-                for process_name, lp, le, ext, trm, ldr in [
-                    (
-                        'movies_genre',
-                        lp_movies,
-                        le_movies,
-                        ExtractorMovies(dsn, proccess_name='movies_genre'),
-                        TransformerMovies(),
-                        LoaderMovies(host=ELASTIC_HOST, port=ELASTIC_PORT, index='movies'),
-                    ),
-                    (
-                        'movies_film_work',
-                        lp_movies,
-                        le_movies,
-                        ExtractorMovies(dsn, proccess_name='movies_film_work'),
-                        TransformerMovies(),
-                        LoaderMovies(host=ELASTIC_HOST, port=ELASTIC_PORT, index='movies'),
-                    ),
-                    (
-                        'movies_person',
-                        lp_movies,
-                        le_movies,
-                        ExtractorMovies(dsn, proccess_name='movies_person'),
-                        TransformerMovies(),
-                        LoaderMovies(host=ELASTIC_HOST, port=ELASTIC_PORT, index='movies'),
-                    ),
-                    (
-                        'genre',
-                        lp_genre,
-                        le_genre,
-                        ExtractorGenres(dsn, proccess_name='genre'),
-                        TransformerGenres(),
-                        LoaderGenres(host=ELASTIC_HOST, port=ELASTIC_PORT, index='genres'),
-                    ),
-                    (
-                        'person',
-                        lp_person,
-                        le_person,
-                        ExtractorPersons(dsn, proccess_name='person'),
-                        TransformerPersons(),
-                        LoaderPersons(host=ELASTIC_HOST, port=ELASTIC_PORT, index='persons'),
-                    ),
-                ]
-            ),
-        )
+        if CHANGE_SOURCE == 'outbox':
+            await outbox_process(
+                redis_adapter, state, shards, (lp_movies, lp_genre, lp_person), pool, loaders, PARTIAL_UPDATES,
+            )
+        else:
+            await modified_process(
+                redis_adapter, state, shards, (lp_movies, lp_genre, lp_person), pool, loaders,
+                partial_updates=PARTIAL_UPDATES,
+            )
 
-        redis_adapter.bgsave()
         logging.info(f'TIME: {time.perf_counter() - t1} s')
-        await asyncio.sleep(int(TIME_SYNC))
+        pool.log_stats()
+        for loader in loaders.values():
+            if loader.fingerprints is not None:
+                logging.info(
+                    f'SKIPPED {loader.index}: {loader.fingerprints.skipped} of {loader.fingerprints.checked} documents',
+                )
+        if listener is not None:
+            await listener.wait(int(TIME_SYNC))
+        else:
+            await asyncio.sleep(int(TIME_SYNC))
 
 
 if __name__ == '__main__':
@@ -117,13 +534,20 @@ if __name__ == '__main__':
     ELASTIC_HOST = os.environ.get('ELASTIC_HOST')
     ELASTIC_PORT = os.environ.get('ELASTIC_PORT')
 
-    for index, file in (
-        ('movies', 'es_config/movies.json'),
-        ('persons', 'es_config/persons.json'),
-        ('genres', 'es_config/genres.json'),
-    ):
-        setup(ELASTIC_HOST, ELASTIC_PORT, index, file)
+    # rebuild replaces the indexes, the other commands need the mapping of the live ones to be current
+    for index, file in INDEXES.items():
+        setup(ELASTIC_HOST, ELASTIC_PORT, index, file, strict=sys.argv[1:2] != ['rebuild'])
 
     dsn = {'dbname': DB_NAME, 'user': DB_USER, 'password': DB_PASSWORD, 'host': DB_HOST, 'port': DB_PORT}
 
-    asyncio.run(main(dsn))
+    # python main.py rebuild [movies genres persons]
+    # python main.py reconcile [movies genres persons]
+    # python main.py backfill movies|genres|persons --ids ID ... | --file FILE | --since TIME [--till TIME]
+    if sys.argv[1:2] == ['rebuild']:
+        asyncio.run(rebuild(dsn, sys.argv[2:] or list(INDEXES)))
+    elif sys.argv[1:2] == ['reconcile']:
+        asyncio.run(reconcile(dsn, sys.argv[2:] or list(INDEXES)))
+    elif sys.argv[1:2] == ['backfill']:
+        asyncio.run(backfill(dsn, **backfill_args(sys.argv[2:])))
+    else:
+        asyncio.run(main(dsn))
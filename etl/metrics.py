@@ -0,0 +1,41 @@
+import datetime
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logging.basicConfig(level=logging.INFO)
+
+ROWS = Counter('etl_rows', 'Rows passed through a pipeline stage', ['pipeline', 'stage'])
+BATCH_ERRORS = Counter('etl_batch_errors', 'Batches failed in a pipeline stage', ['pipeline', 'stage'])
+QUEUE_DEPTH = Gauge('etl_queue_depth', 'Batches waiting in front of a pipeline stage', ['pipeline', 'stage'])
+DIRTY_IDS = Gauge('etl_dirty_ids', 'Ids in the work set of a dirty set', ['process'])
+BULK_SECONDS = Histogram(
+    'etl_es_bulk_seconds',
+    'Latency of Elasticsearch bulk requests',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+BULK_DOCUMENTS = Counter('etl_es_bulk_documents', 'Documents sent in bulk requests')
+REJECTED = Counter('etl_es_rejected', 'Documents rejected by Elasticsearch', ['status'])
+CHECKPOINT_LAG = Gauge('etl_checkpoint_lag_seconds', 'Now minus the last synced modified time', ['process'])
+
+_checkpoints = {}
+
+
+def checkpoint(name: str, value: dict):
+    # The lag is computed on every scrape, so a process that stopped syncing keeps falling behind
+    modified = value.get('modified') or value.get('window')
+    if not isinstance(modified, datetime.datetime):
+        return
+    if name not in _checkpoints:
+        CHECKPOINT_LAG.labels(name).set_function(lambda: time.time() - _checkpoints[name])
+    _checkpoints[name] = modified.timestamp()
+
+
+def start(port=None):
+    # ETL_METRICS_PORT=0 turns the endpoint off
+    port = int(port or os.environ.get('ETL_METRICS_PORT', 8001))
+    if port:
+        start_http_server(port)
+        logging.info(f'METRICS: http://0.0.0.0:{port}/metrics')
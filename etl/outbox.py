@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+
+import psycopg
+from backoff import backoff
+from sql_queries import (FILM_IDS_BY_GENRE, FILM_IDS_BY_PERSON, OUTBOX,
+                         OUTBOX_PRUNE, OUTBOX_XACT, PERSON_IDS_BY_FILM)
+
+logging.basicConfig(level=logging.INFO)
+
+OUTBOX_CHANNEL = 'content_outbox'
+
+
+class OutboxConsumer:
+    def __init__(self, pool, state, movies, genres, persons, proccess_name='outbox', page_size=1000, fan_out=True):
+        # without fan_out a changed genre or person does not mark its films dirty, renames are patched in place
+        self.pool = pool
+        self.fan_out = fan_out
+        self.state = state
+        self.movies = movies
+        self.genres = genres
+        self.persons = persons
+        self.proccess_name = proccess_name
+        self.page_size = page_size
+        self.retention_hours = int(os.environ.get('OUTBOX_RETENTION_HOURS', 24))
+
+    async def _fan_out(self, aconn, query, ids, target):
+        # related ids of popular entities are read and marked dirty in bounded chunks
+        async with aconn.cursor(name=f'{self.proccess_name}_cursor') as acur:
+            await acur.execute(query, (list(ids),))
+            while res := await acur.fetchmany(self.page_size):
+                await target.start([str(row[0]) for row in res])
+
+    async def _route(self, aconn, rows):
+        ids = {'film_work': set(), 'genre': set(), 'person': set(), 'person_films': set()}
+        for _, entity, entity_id, _ in rows:
+            ids[entity].add(str(entity_id))
+
+        await self.movies.start(list(ids['film_work']))
+        if self.fan_out:
+            for entity, query in (('genre', FILM_IDS_BY_GENRE), ('person', FILM_IDS_BY_PERSON)):
+                if ids[entity]:
+                    await self._fan_out(aconn, query, ids[entity], self.movies)
+
+        await self.genres.start(list(ids['genre']))
+        # persons documents carry their filmography, so film changes mark their persons dirty too
+        await self.persons.start(list(ids['person'] | ids['person_films']))
+        if ids['film_work']:
+            await self._fan_out(aconn, PERSON_IDS_BY_FILM, ids['film_work'], self.persons)
+
+    async def _checkpoint(self, aconn) -> tuple[int, int]:
+        # Rows are read in (transaction id, id) order. A checkpoint of the previous versions
+        # only has the row id, the transaction of that row is looked up once.
+        checkpoint = self.state.get(self.proccess_name)
+        last_seq = int(checkpoint.get('window') or 0)
+        if 'xact' in checkpoint or not last_seq:
+            return int(checkpoint.get('xact') or 0), last_seq
+        async with aconn.cursor() as acur:
+            await acur.execute(OUTBOX_XACT, (last_seq,))
+            row = await acur.fetchone()
+        return (row[0] if row else 0), last_seq
+
+    @backoff()
+    async def start(self, lock):
+        await lock.acquire()
+        try:
+            async with self.pool.connection() as aconn:
+                last_xact, last_seq = await self._checkpoint(aconn)
+                while True:
+                    # only transactions older than the snapshot xmin are read, all of them are finished
+                    async with aconn.cursor() as acur:
+                        await acur.execute(OUTBOX, (last_xact, last_seq, self.page_size))
+                        rows = await acur.fetchall()
+                    if not rows:
+                        break
+                    await self._route(aconn, rows)
+                    last_seq, last_xact = rows[-1][0], rows[-1][3]
+                    self.state.set(self.proccess_name, {'window': last_seq, 'xact': last_xact})
+                    logging.info(f'OUTBOX: {len(rows)} changes, sequence {last_seq}')
+                    if len(rows) < self.page_size:
+                        break
+
+                async with aconn.cursor() as acur:
+                    await acur.execute(OUTBOX_PRUNE, (last_xact, last_seq, self.retention_hours))
+        finally:
+            lock.release()
+
+
+class OutboxListener:
+    def __init__(self, dsn: dict, channel: str = OUTBOX_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.aconn = None
+
+    async def _connect(self):
+        self.aconn = await psycopg.AsyncConnection.connect(**self.dsn, autocommit=True)
+        await self.aconn.execute(f'LISTEN {self.channel}')
+
+    async def wait(self, timeout: float):
+        # Returns on the first notification from the outbox triggers or after timeout seconds
+        try:
+            if self.aconn is None or self.aconn.closed:
+                await self._connect()
+            async for _ in self.aconn.notifies(timeout=timeout, stop_after=1):
+                pass
+        except psycopg.OperationalError as e:
+            logging.warning(f'OUTBOX: listener connection is lost: {e}')
+            self.aconn = None
+            await asyncio.sleep(timeout)
+
+    async def close(self):
+        if self.aconn is not None:
+            await self.aconn.close()
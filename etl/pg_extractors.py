@@ -1,106 +1,207 @@
 import datetime
 import logging
+from functools import partial
 
-import psycopg
+import metrics
 from backoff import backoff_generator
-from sql_queries import (EXTRUCT, FILM_IDS_BY_GENRE, FILM_IDS_BY_PERSON,
-                         RAW_GENRE_EXTRUCT, RAW_PERSONS, WHERE_CLAUSE_IN,
-                         WHERE_CLAUSE_MODIFIED)
+from sql_queries import (EXTRUCT, EXTRUCT_JSON, FILM_IDS_BY_GENRE,
+                         FILM_IDS_BY_PERSON, FILM_WORK_BY_IDS, FILM_WORK_PAGE,
+                         GENRES_BY_IDS, PERSON_IDS_BY_FILM, PERSONS_BY_IDS,
+                         RAW_FILM_WORK, RAW_GENRE_EXTRUCT, RAW_PERSON_IDS,
+                         RAW_PERSONS)
+from state import Batch
 
 logging.basicConfig(level=logging.INFO)
 
+MIN_UUID = '00000000-0000-0000-0000-000000000000'
 
-class ExtractorMovies:
-    def __init__(self, dsn, proccess_name, fetch_size=100):
-        self.dsn = dsn
+
+class Extractor:
+    def __init__(self, pool, proccess_name, fetch_size=100, page_size=1000):
+        self.pool = pool
         self.proccess_name = proccess_name
         self.fetch_size = fetch_size
+        self.page_size = page_size
 
-    async def _extruct_filmwork(self, acur, from_time, till_time):
-        where_clause = WHERE_CLAUSE_MODIFIED % (str(from_time), str(till_time))
-        await acur.execute(EXTRUCT.format(where_clause))
-        while res := await acur.fetchmany(self.fetch_size):
-            yield res
-
-    async def _extruct_genre(self, acur, from_time, till_time):
-        await acur.execute(FILM_IDS_BY_GENRE, (str(from_time), str(till_time)))
-        res = await acur.fetchall()
-        flat_res = ["'" + str(item) + "'" for sublist in res for item in sublist]
-        if len(flat_res) > 0:
-            where_clause = WHERE_CLAUSE_IN.format(', '.join(flat_res))
-            await acur.execute(EXTRUCT.format(where_clause))
-            while res := await acur.fetchmany(self.fetch_size):
+    async def _stream(self, aconn, query, params=None, size=None):
+        async with aconn.cursor(name=f'{self.proccess_name}_cursor') as acur:
+            await acur.execute(query, params)
+            while res := await acur.fetchmany(size or self.fetch_size):
                 yield res
 
-    async def _extruct_person(self, acur, from_time, till_time):
-        await acur.execute(FILM_IDS_BY_PERSON, (str(from_time), str(till_time)))
-        res = await acur.fetchall()
-        flat_res = ["'" + str(item) + "'" for sublist in res for item in sublist]
-        if len(flat_res) > 0:
-            where_clause = WHERE_CLAUSE_IN.format(', '.join(flat_res))
-            await acur.execute(EXTRUCT.format(where_clause))
-            while res := await acur.fetchmany(self.fetch_size):
-                yield res
 
-    @backoff_generator()
-    async def start(self, redis_adapter, lock, time_delta):
-        from_time = datetime.datetime.fromisoformat(redis_adapter.get(self.proccess_name))
-        till_time = from_time + time_delta
-        await lock.acquire()
-        try:
-            async with await psycopg.AsyncConnection.connect(**self.dsn) as aconn:
-                async with aconn.cursor() as acur:
-                    if self.proccess_name == 'movies_film_work':
-                        async for res in self._extruct_filmwork(acur, from_time, till_time):
-                            yield res
-                    elif self.proccess_name == 'movies_genre':
-                        async for res in self._extruct_genre(acur, from_time, till_time):
-                            yield res
-                    elif self.proccess_name == 'movies_person':
-                        async for res in self._extruct_person(acur, from_time, till_time):
-                            yield res
-            redis_adapter.set(self.proccess_name, str(till_time))
-        finally:
-            if self.proccess_name == 'movies_genre':
-                logging.info(f'GENRE: {redis_adapter.get(self.proccess_name)}')
-            lock.release()
+class KeysetExtractor(Extractor):
+    def __init__(self, pool, proccess_name, state, fetch_size=100, page_size=1000, shard=0, shards=1):
+        # Rows are split into shards by id hash, the extractor reads only its own shard
+        super().__init__(pool, proccess_name, fetch_size, page_size)
+        self.state = state
+        self.shard = shard
+        self.shards = shards
 
-class ExtractorPersons:
-    def __init__(self, dsn: dict, proccess_name: str):
-        self.dsn = dsn
-        self.proccess_name = proccess_name
+    def _params(self, modified, last_id, till_time):
+        return modified, last_id, till_time, self.shards, self.shard, self.page_size
+
+    def _checkpoint(self, from_time, row):
+        # (modified, id) of the last row of the batch, stored by the pipeline once the batch is loaded
+        return partial(
+            self.state.set, self.proccess_name, {'window': from_time, 'modified': row[-1], 'id': row[0]},
+        )
+
+    def _get_position(self, from_time):
+        checkpoint = self.state.get(self.proccess_name)
+        if 'modified' in checkpoint and datetime.datetime.fromisoformat(checkpoint['window']) == from_time:
+            return datetime.datetime.fromisoformat(checkpoint['modified']), checkpoint['id']
+        return from_time, MIN_UUID
+
+    async def _pages(self, aconn, query, from_time, till_time):
+        # Keyset pagination over (modified, id): every page is a bounded slice streamed through
+        # a server-side cursor, every batch carries the position right after its last row.
+        modified, last_id = self._get_position(from_time)
+        while True:
+            rows = 0
+            async for res in self._stream(aconn, query, self._params(modified, last_id, till_time)):
+                rows += len(res)
+                modified, last_id = res[-1][-1], res[-1][0]
+                yield Batch(res, self._checkpoint(from_time, res[-1]))
+            await aconn.commit()
+            if rows < self.page_size:
+                return
+
+    async def _extruct(self, aconn, from_time, till_time):
+        async for res in self._pages(aconn, self.QUERY, from_time, till_time):
+            yield res
 
     @backoff_generator()
-    async def start(self, redis_adapter, lock, time_delta, fetch_size=100):
-        from_time = datetime.datetime.fromisoformat(redis_adapter.get(self.proccess_name))
+    async def start(self, lock, time_delta):
+        from_time = datetime.datetime.fromisoformat(self.state.get(self.proccess_name)['window'])
         till_time = from_time + time_delta
         await lock.acquire()
         try:
-            async with await psycopg.AsyncConnection.connect(**self.dsn) as aconn:
-                async with aconn.cursor() as acur:
-                    await acur.execute(RAW_PERSONS, (str(from_time), str(till_time)))
-                    while res := await acur.fetchmany(fetch_size):
-                        yield res
-            redis_adapter.set(self.proccess_name, str(till_time))
+            async with self.pool.connection() as aconn:
+                async for res in self._extruct(aconn, from_time, till_time):
+                    yield res
+            yield Batch(checkpoint=partial(self.state.set, self.proccess_name, {'window': till_time}))
         finally:
             lock.release()
 
-class ExtractorGenres:
-    def __init__(self, dsn, proccess_name):
-        self.dsn = dsn
-        self.proccess_name = proccess_name
+
+class ChangeCollector(KeysetExtractor):
+    async def _collect_filmwork(self, aconn, from_time, till_time):
+        async for res in self._pages(aconn, RAW_FILM_WORK, from_time, till_time):
+            yield Batch([str(row[0]) for row in res], res.checkpoint)
+
+    async def _collect_films_by(self, aconn, from_time, till_time, keyset_query, ids_query):
+        modified, last_id = self._get_position(from_time)
+        while True:
+            async with aconn.cursor() as acur:
+                await acur.execute(keyset_query, self._params(modified, last_id, till_time))
+                changed = await acur.fetchall()
+            if not changed:
+                return
+
+            # a popular genre or person fans out to many films, they are read in bounded chunks
+            async for res in self._stream(aconn, ids_query, ([row[0] for row in changed],), self.page_size):
+                yield Batch([str(row[0]) for row in res])
+            await aconn.commit()
+            modified, last_id = changed[-1][-1], changed[-1][0]
+            yield Batch(checkpoint=self._checkpoint(from_time, changed[-1]))
+            if len(changed) < self.page_size:
+                return
+
+    async def _collect_genre(self, aconn, from_time, till_time):
+        async for res in self._collect_films_by(aconn, from_time, till_time, RAW_GENRE_EXTRUCT, FILM_IDS_BY_GENRE):
+            yield res
+
+    async def _collect_person(self, aconn, from_time, till_time):
+        async for res in self._collect_films_by(aconn, from_time, till_time, RAW_PERSON_IDS, FILM_IDS_BY_PERSON):
+            yield res
+
+    async def _collect_film_persons(self, aconn, from_time, till_time):
+        # persons documents carry film titles, so changed films mark their persons dirty
+        async for res in self._collect_films_by(aconn, from_time, till_time, RAW_FILM_WORK, PERSON_IDS_BY_FILM):
+            yield res
+
+    async def _extruct(self, aconn, from_time, till_time):
+        source = self.proccess_name.partition(':')[0]
+        if source == 'movies_film_work':
+            collect = self._collect_filmwork
+        elif source == 'movies_genre':
+            collect = self._collect_genre
+        elif source == 'movies_person':
+            collect = self._collect_person
+        elif source == 'persons_film_work':
+            collect = self._collect_film_persons
+        async for res in collect(aconn, from_time, till_time):
+            yield res
+
+
+class DirtyExtractor(Extractor):
+    def __init__(self, pool, proccess_name, dirty_set, remover=None, fetch_size=100, page_size=1000):
+        super().__init__(pool, proccess_name, fetch_size, page_size)
+        self.dirty_set = dirty_set
+        self.remover = remover
+
+    async def _extruct_by_ids(self, aconn, ids):
+        async for res in self._stream(aconn, self.QUERY, (ids,)):
+            yield res
 
     @backoff_generator()
-    async def start(self, redis_adapter, lock, time_delta, fetch_size=100):
-        from_time = datetime.datetime.fromisoformat(redis_adapter.get(self.proccess_name))
-        till_time = from_time + time_delta
+    async def start(self, lock):
+        # Every dirty entity is built exactly once per cycle, ids that are gone from Postgres are deleted.
+        # Ids leave the work set only after all of their documents are loaded.
+        self.dirty_set.begin_cycle()
+        size = self.dirty_set.size()
+        metrics.DIRTY_IDS.labels(self.proccess_name).set(size)
+        logging.info(f'{self.proccess_name.upper()}: {size} dirty ids')
         await lock.acquire()
         try:
-            async with await psycopg.AsyncConnection.connect(**self.dsn) as aconn:
-                async with aconn.cursor() as acur:
-                    await acur.execute(RAW_GENRE_EXTRUCT, (str(from_time), str(till_time)))
-                    while res := await acur.fetchmany(fetch_size):
+            async with self.pool.connection() as aconn:
+                for ids in self.dirty_set.scan(self.page_size):
+                    found = set()
+                    async for res in self._extruct_by_ids(aconn, ids):
+                        found.update(str(row[0]) for row in res)
                         yield res
-            redis_adapter.set(self.proccess_name, str(till_time))
+                    await aconn.commit()
+                    missing = [item for item in ids if item not in found]
+                    if missing and self.remover is not None:
+                        await self.remover(missing)
+                    yield Batch(checkpoint=partial(self.dirty_set.done, ids))
         finally:
             lock.release()
+
+
+class ExtractorMovies(DirtyExtractor):
+    QUERY = EXTRUCT.format(FILM_WORK_BY_IDS)
+
+    def __init__(self, pool, dirty_set, remover=None, fetch_size=100, page_size=1000):
+        super().__init__(pool, 'movies', dirty_set, remover, fetch_size, page_size)
+
+
+class ExtractorGenresByIds(DirtyExtractor):
+    QUERY = GENRES_BY_IDS
+
+
+class ExtractorPersonsByIds(DirtyExtractor):
+    QUERY = PERSONS_BY_IDS
+
+
+class ExtractorMoviesFull(KeysetExtractor):
+    # Whole movie documents in (modified, id) order, used to build an index from scratch
+    QUERY = EXTRUCT.format(FILM_WORK_PAGE)
+
+
+class ExtractorMoviesJson(ExtractorMovies):
+    # Rows are (id, document, modified), the document is built by Postgres
+    QUERY = EXTRUCT_JSON.format(FILM_WORK_BY_IDS)
+
+
+class ExtractorMoviesFullJson(KeysetExtractor):
+    QUERY = EXTRUCT_JSON.format(FILM_WORK_PAGE)
+
+
+class ExtractorPersons(KeysetExtractor):
+    QUERY = RAW_PERSONS
+
+
+class ExtractorGenres(KeysetExtractor):
+    QUERY = RAW_GENRE_EXTRUCT
@@ -0,0 +1,51 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool
+
+logging.basicConfig(level=logging.INFO)
+
+
+class PostgresPool:
+    def __init__(self, dsn: dict):
+        self.pool = AsyncConnectionPool(
+            kwargs={**dsn, 'prepare_threshold': int(os.environ.get('PG_PREPARE_THRESHOLD', 0))},
+            min_size=int(os.environ.get('PG_POOL_MIN_SIZE', 1)),
+            max_size=int(os.environ.get('PG_POOL_MAX_SIZE', 5)),
+            max_idle=float(os.environ.get('PG_POOL_MAX_IDLE', 600)),
+            check=AsyncConnectionPool.check_connection,
+            name='etl',
+            open=False,
+        )
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.requests = 0
+
+    async def open(self):
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def connection(self):
+        t1 = time.perf_counter()
+        async with self.pool.connection() as aconn:
+            wait_time = time.perf_counter() - t1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.requests += 1
+            yield aconn
+
+    def log_stats(self):
+        stats = self.pool.pop_stats()
+        avg_wait = self.wait_time / self.requests if self.requests else 0.0
+        logging.info(
+            f'PG POOL: size {stats.get("pool_size", 0)}, available {stats.get("pool_available", 0)}, '
+            f'requests {self.requests}, avg wait {avg_wait * 1000:.1f} ms, max wait {self.max_wait_time * 1000:.1f} ms',
+        )
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.requests = 0
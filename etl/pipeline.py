@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import aclosing
+
+import metrics
+
+logging.basicConfig(level=logging.INFO)
+
+
+class StageStats:
+    def __init__(self, name: str, concurrency: int = 1):
+        self.name = name
+        self.concurrency = concurrency
+        self.batches = 0
+        self.rows = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    def report(self, elapsed: float, depth: int) -> str:
+        rate = self.rows / elapsed if elapsed else 0.0
+        busy = self.busy_time / (elapsed * self.concurrency) * 100 if elapsed else 0.0
+        return (
+            f'{self.name}: {self.rows} rows, {rate:.1f} rows/s, busy {busy:.0f}%, '
+            f'queue {depth} (max {self.max_depth})'
+        )
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Pipeline:
+    def __init__(self, name: str, stages: list, queue_size: int | None = None):
+        # stages is a list of (stage, concurrency), every stage has an async start(data) method
+        self.name = name
+        self.stages = stages
+        queue_size = queue_size or int(os.environ.get('PIPELINE_QUEUE_SIZE', 4))
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+        self.stats = [StageStats(type(stage).__name__, concurrency) for stage, concurrency in stages]
+        self.source_stats = StageStats('extract')
+        self.errors = 0
+        self.started = time.perf_counter()
+        for queue, stats in zip(self.queues, self.stats):
+            metrics.QUEUE_DEPTH.labels(name, stats.name).set_function(queue.qsize)
+        self._reset()
+
+    def _reset(self):
+        self.next_seq = 0
+        self.committed_seq = 0
+        self.checkpoints = {}
+        self.finished = set()
+        self.failed_seq = None
+
+    def _finish(self, seq: int):
+        # Checkpoints are stored strictly in extraction order and never past a failed batch,
+        # batches before the failed one still store theirs when they finish after it
+        self.finished.add(seq)
+        while self.committed_seq in self.finished and (self.failed_seq is None or self.committed_seq < self.failed_seq):
+            self.finished.discard(self.committed_seq)
+            checkpoint = self.checkpoints.pop(self.committed_seq)
+            if checkpoint is not None:
+                checkpoint()
+            self.committed_seq += 1
+
+    def _fail(self, seq: int):
+        self.errors += 1
+        if self.failed_seq is None or seq < self.failed_seq:
+            self.failed_seq = seq
+
+    async def _worker(self, index: int):
+        stage, _ = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        stats = self.stats[index]
+        while True:
+            seq, data = await inbox.get()
+            try:
+                t1 = time.perf_counter()
+                result = await stage.start(data)
+                stats.busy_time += time.perf_counter() - t1
+                stats.batches += 1
+                stats.rows += len(data)
+                metrics.ROWS.labels(self.name, stats.name).inc(len(data))
+                if outbox is not None and result:
+                    await outbox.put((seq, result))
+                    stats.max_depth = max(stats.max_depth, outbox.qsize())
+                else:
+                    self._finish(seq)
+            except Exception:
+                self._fail(seq)
+                metrics.BATCH_ERRORS.labels(self.name, stats.name).inc()
+                logging.exception(f'PIPELINE {self.name}: {stats.name} failed')
+            finally:
+                inbox.task_done()
+
+    async def drain(self):
+        # Waits until every batch that entered the pipeline has left the last stage
+        for queue in self.queues:
+            await queue.join()
+
+    async def _report(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.log_stats()
+
+    def log_stats(self):
+        elapsed = time.perf_counter() - self.started
+        reports = [self.source_stats.report(elapsed, self.queues[0].qsize())]
+        for index, stats in enumerate(self.stats):
+            depth = self.queues[index + 1].qsize() if index + 1 < len(self.queues) else 0
+            reports.append(stats.report(elapsed, depth))
+        logging.info(f'PIPELINE {self.name}: ' + '; '.join(reports))
+
+    async def run(self, source):
+        workers = [
+            asyncio.create_task(self._worker(index))
+            for index, (_, concurrency) in enumerate(self.stages)
+            for _ in range(concurrency)
+        ]
+        workers.append(asyncio.create_task(self._report(float(os.environ.get('PIPELINE_REPORT_INTERVAL', 60)))))
+        self._reset()
+        try:
+            t1 = time.perf_counter()
+            # a source left early is closed at once, extractors hold a connection and a lock until then
+            async with aclosing(source):
+                async for data in source:
+                    self.source_stats.busy_time += time.perf_counter() - t1
+                    seq = self.next_seq
+                    self.next_seq += 1
+                    self.checkpoints[seq] = getattr(data, 'checkpoint', None)
+                    if not data:
+                        self._finish(seq)
+                    else:
+                        self.source_stats.batches += 1
+                        self.source_stats.rows += len(data)
+                        metrics.ROWS.labels(self.name, self.source_stats.name).inc(len(data))
+                        await self.queues[0].put((seq, data))
+                        self.source_stats.max_depth = max(self.source_stats.max_depth, self.queues[0].qsize())
+                    if self.failed_seq is not None:
+                        break
+                    t1 = time.perf_counter()
+            await self.drain()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.failed_seq is not None:
+            raise PipelineError(f'{self.name}: batch {self.failed_seq} is not loaded, progress is kept before it')
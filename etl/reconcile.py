@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from sql_queries import BUCKET_CHECKSUMS, BUCKET_ROWS
+
+logging.basicConfig(level=logging.INFO)
+
+# index -> table its documents are built from
+TABLES = {'movies': 'film_work', 'genres': 'genre', 'persons': 'person'}
+
+# ids are bucketed by their leading hex digits, the first group of an uuid has 8 of them
+MAX_DEPTH = 8
+
+ES_BUCKET = "doc['id'].value.substring(0, params.length)"
+ES_MODIFIED = "doc['modified'].size() == 0 ? 0 : doc['modified'].value.toEpochSecond()"
+
+
+def _bounds(prefix: str) -> tuple[uuid.UUID, uuid.UUID]:
+    # ids starting with prefix are one range of the primary key
+    return uuid.UUID(prefix.ljust(32, '0')), uuid.UUID(prefix.ljust(32, 'f'))
+
+
+def _query(prefix: str) -> dict:
+    return {'prefix': {'id': prefix}} if prefix else {'match_all': {}}
+
+
+class Reconciler:
+    # Finds documents that drifted from Postgres. Both sides are grouped into buckets by the leading
+    # digits of the id and every bucket gets a checksum: the number of rows and the sum of their
+    # modified seconds. Only buckets that differ are split further, and only buckets small enough
+    # are compared id by id. Ids that differ go to the dirty set of the index and are reloaded
+    # (or deleted) by the running ETL.
+    def __init__(self, pool, engine, index: str, dirty_set, fingerprints, depth=None, compare_limit=None):
+        self.pool = pool
+        self.engine = engine
+        self.index = index
+        self.table = TABLES[index]
+        self.dirty_set = dirty_set
+        self.fingerprints = fingerprints
+        self.depth = int(depth or os.environ.get('RECONCILE_BUCKET_DEPTH', 2))
+        self.compare_limit = int(compare_limit or os.environ.get('RECONCILE_COMPARE_LIMIT', 5000))
+        self.queries = 0
+        self.buckets = 0
+        self.diverged = 0
+
+    async def _pg_buckets(self, prefix: str, length: int) -> dict:
+        async with self.pool.connection() as aconn:
+            async with aconn.cursor() as acur:
+                await acur.execute(BUCKET_CHECKSUMS.format(self.table), (length, *_bounds(prefix)))
+                return {bucket: (count, checksum) for bucket, count, checksum in await acur.fetchall()}
+
+    async def _es_buckets(self, prefix: str, length: int) -> dict:
+        body = {
+            'size': 0,
+            'query': _query(prefix),
+            'aggs': {
+                'buckets': {
+                    'terms': {
+                        'script': {'source': ES_BUCKET, 'lang': 'painless', 'params': {'length': length}},
+                        'size': 16 ** (length - len(prefix)),
+                    },
+                    'aggs': {'modified': {'sum': {'script': {'source': ES_MODIFIED, 'lang': 'painless'}}}},
+                },
+            },
+        }
+        result = await self.engine.search(self.index, body)
+        return {
+            item['key']: (item['doc_count'], int(item['modified']['value']))
+            for item in result['aggregations']['buckets']['buckets']
+        }
+
+    async def _pg_rows(self, prefix: str) -> dict:
+        async with self.pool.connection() as aconn:
+            async with aconn.cursor() as acur:
+                await acur.execute(BUCKET_ROWS.format(self.table), _bounds(prefix))
+                return dict(await acur.fetchall())
+
+    async def _es_rows(self, prefix: str, size: int) -> dict:
+        body = {
+            'size': size,
+            '_source': False,
+            'query': _query(prefix),
+            'docvalue_fields': [{'field': 'modified', 'format': 'epoch_second'}],
+        }
+        result = await self.engine.search(self.index, body)
+        return {
+            hit['_id']: int(float(hit.get('fields', {}).get('modified', [0])[0]))
+            for hit in result['hits']['hits']
+        }
+
+    async def _compare(self, prefix: str, size: int):
+        pg, es = await asyncio.gather(self._pg_rows(prefix), self._es_rows(prefix, size))
+        ids = [key for key in pg.keys() | es.keys() if pg.get(key) != es.get(key)]
+        # a document missing in the index or left behind there has the fingerprint of its last load,
+        # without forgetting it the reload would skip the document as unchanged
+        self.fingerprints.forget(ids)
+        await self.dirty_set.start(ids)
+        self.diverged += len(ids)
+
+    async def _check(self, prefix: str, length: int):
+        pg, es = await asyncio.gather(self._pg_buckets(prefix, length), self._es_buckets(prefix, length))
+        self.queries += 1
+        for bucket in sorted(pg.keys() | es.keys()):
+            if pg.get(bucket) == es.get(bucket):
+                continue
+            self.buckets += 1
+            size = max(pg.get(bucket, (0, 0))[0], es.get(bucket, (0, 0))[0])
+            if size <= self.compare_limit or len(bucket) >= MAX_DEPTH:
+                await self._compare(bucket, size)
+            else:
+                await self._check(bucket, len(bucket) + 1)
+
+    async def start(self) -> int:
+        t1 = time.perf_counter()
+        await self._check('', self.depth)
+        logging.info(
+            f'RECONCILE {self.index}: {self.diverged} documents diverged in {self.buckets} buckets, '
+            f'{self.queries} checksum queries, {time.perf_counter() - t1:.1f} s',
+        )
+        return self.diverged
@@ -1,11 +1,87 @@
+import json
+import logging
+import time
+
 import requests
 
+logging.basicConfig(level=logging.INFO)
+
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class MappingError(Exception):
+    pass
+
+
+def setup(elastic_host, elastic_port, index, data_json, strict=True):
+    # The API reads an alias, a fresh install gets the first versioned index behind it
+    base = f'http://{elastic_host}:{elastic_port}'
+    with open(data_json) as f:
+        data = json.load(f)
+
+    if requests.head(f'{base}/{index}').status_code != 200:
+        data['aliases'] = {index: {}}
+        res = requests.put(f'{base}/{index}_v1', headers=HEADERS, json=data)
+        res.raise_for_status()
+    else:
+        # Fields added to the mapping later are added to the live index, a changed field needs a rebuild.
+        # Documents of the new shape are rejected by the old mapping, so the ETL does not start on it.
+        res = requests.put(f'{base}/{index}/_mapping', headers=HEADERS, json=data['mappings'])
+        if res.status_code == 200:
+            return
+        message = f'SETUP: mapping of {index} is not updated, run "python main.py rebuild {index}": {res.text}'
+        if strict:
+            raise MappingError(message)
+        logging.warning(message)
+
+
+def create_shadow(elastic_host, elastic_port, index, data_json):
+    # A new versioned index that is built without refreshes and replicas, returns its name and
+    # the settings to restore before it goes live
+    with open(data_json) as f:
+        data = json.load(f)
+    settings = data.setdefault('settings', {})
+    live_settings = {
+        'refresh_interval': settings.get('refresh_interval', '1s'),
+        'number_of_replicas': settings.get('number_of_replicas', 1),
+    }
+    settings.update({'refresh_interval': '-1', 'number_of_replicas': 0})
+
+    name = f'{index}_{time.strftime("%Y%m%d%H%M%S")}'
+    res = requests.put(f'http://{elastic_host}:{elastic_port}/{name}', headers=HEADERS, json=data)
+    res.raise_for_status()
+    logging.info(f'REBUILD: {name} is created')
+    return name, live_settings
+
+
+def finish_shadow(elastic_host, elastic_port, name, live_settings):
+    base = f'http://{elastic_host}:{elastic_port}'
+    res = requests.put(f'{base}/{name}/_settings', headers=HEADERS, json={'index': live_settings})
+    res.raise_for_status()
+    requests.post(f'{base}/{name}/_refresh').raise_for_status()
+    res = requests.get(f'{base}/_cluster/health/{name}', params={'wait_for_status': 'yellow', 'timeout': '60s'})
+    res.raise_for_status()
+
+
+def swap_alias(elastic_host, elastic_port, index, name):
+    # Points the alias to the new index in one atomic call and drops the indexes it pointed to.
+    # An index created before aliases were used has the alias name itself and is replaced.
+    base = f'http://{elastic_host}:{elastic_port}'
+    res = requests.get(f'{base}/_alias/{index}')
+    if res.status_code == 200:
+        old = [item for item in res.json() if item != name]
+        actions = [{'remove': {'index': item, 'alias': index}} for item in old]
+    elif requests.head(f'{base}/{index}').status_code == 200:
+        old = []
+        actions = [{'remove_index': {'index': index}}]
+    else:
+        old = []
+        actions = []
+    actions.append({'add': {'index': name, 'alias': index}})
 
-def setup(elastic_host, elastic_port, index, data_json):
-    res = requests.head(f'http://{elastic_host}:{elastic_port}/{index}')
+    res = requests.post(f'{base}/_aliases', headers=HEADERS, json={'actions': actions})
+    res.raise_for_status()
+    logging.info(f'REBUILD: {index} points to {name}')
 
-    if res.status_code != 200:
-        with open(data_json) as f:
-            data = f.read()
-        headers = {'Content-Type': 'application/json'}
-        res = requests.put(f'http://{elastic_host}:{elastic_port}/{index}', headers=headers, data=data)
+    for item in old:
+        requests.delete(f'{base}/{item}').raise_for_status()
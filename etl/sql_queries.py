@@ -1,27 +1,76 @@
-RAW_PERSONS = '''
-SELECT p.id,
-       p.full_name,
-       p.modified
+PERSON_FILMS = '''    COALESCE((
+        SELECT json_agg(json_build_object('id', f.id, 'title', f.title, 'roles', f.roles) ORDER BY f.title, f.id)
+        FROM (
+            SELECT fw.id, fw.title, ARRAY_AGG(DISTINCT pfw.role ORDER BY pfw.role) AS roles
+            FROM content.person_film_work pfw
+            JOIN content.film_work fw ON fw.id = pfw.film_work_id
+            WHERE pfw.person_id = p.id
+            GROUP BY fw.id, fw.title
+        ) AS f
+    ), '[]') AS films,
+'''
+
+RAW_PERSONS = '''SELECT
+    p.id,
+    p.full_name,
+{}    p.modified
+FROM content.person p
+WHERE (p.modified, p.id) > (%s, %s) AND p.modified < %s
+    AND mod(hashtext(p.id::text) & 2147483647, %s) = %s
+ORDER BY p.modified, p.id
+LIMIT %s
+'''.format(PERSON_FILMS)
+
+RAW_PERSON_IDS = '''SELECT
+    p.id,
+    p.modified
 FROM content.person p
-WHERE p.modified >= %s AND p.modified < %s
+WHERE (p.modified, p.id) > (%s, %s) AND p.modified < %s
+    AND mod(hashtext(p.id::text) & 2147483647, %s) = %s
+ORDER BY p.modified, p.id
+LIMIT %s
 '''
 
-WHERE_CLAUSE_MODIFIED = "fw.modified >= '%s' AND fw.modified < '%s'"
+RAW_FILM_WORK = '''SELECT
+    fw.id,
+    fw.modified
+FROM content.film_work fw
+WHERE (fw.modified, fw.id) > (%s, %s) AND fw.modified < %s
+    AND mod(hashtext(fw.id::text) & 2147483647, %s) = %s
+ORDER BY fw.modified, fw.id
+LIMIT %s
+'''
 
-WHERE_CLAUSE_IN = 'fw.id IN ({})'
+FILM_WORK_WHERE = '''SELECT
+    fw.id,
+    fw.title,
+    fw.description,
+    fw.rating,
+    fw.modified
+FROM content.film_work fw
+WHERE {}
+'''
 
-FILM_IDS_BY_GENRE = '''SELECT DISTINCT fw.id
-FROM content.genre g
-LEFT JOIN content.genre_film_work gfw ON gfw.genre_id = g.id
-LEFT JOIN content.film_work fw ON fw.id = gfw.film_work_id
-WHERE g.modified >= %s AND g.modified < %s
+PERSON_IDS_BY_FILM = '''SELECT pfw.person_id
+FROM content.person_film_work pfw
+WHERE pfw.film_work_id = ANY(%s::uuid[])
 '''
 
-FILM_IDS_BY_PERSON = '''SELECT DISTINCT fw.id
-FROM content.person p
-LEFT JOIN content.person_film_work pfw ON p.id = pfw.person_id
-LEFT JOIN content.film_work fw ON fw.id = pfw.film_work_id
-WHERE p.modified >= %s AND p.modified < %s
+FILM_WORK_BY_IDS = FILM_WORK_WHERE.format('fw.id = ANY(%s::uuid[])')
+
+FILM_WORK_PAGE = FILM_WORK_WHERE.format('''(fw.modified, fw.id) > (%s, %s) AND fw.modified < %s
+    AND mod(hashtext(fw.id::text) & 2147483647, %s) = %s
+ORDER BY fw.modified, fw.id
+LIMIT %s''')
+
+FILM_IDS_BY_GENRE = '''SELECT gfw.film_work_id
+FROM content.genre_film_work gfw
+WHERE gfw.genre_id = ANY(%s::uuid[])
+'''
+
+FILM_IDS_BY_PERSON = '''SELECT pfw.film_work_id
+FROM content.person_film_work pfw
+WHERE pfw.person_id = ANY(%s::uuid[])
 '''
 
 EXTRUCT = '''SELECT
@@ -32,21 +81,25 @@ EXTRUCT = '''SELECT
     subquery.person_ids,
     subquery.roles,
     subquery.full_names,
-    ARRAY_AGG(g.name) AS genres
+    COALESCE(
+        json_agg(json_build_object('id', g.id, 'name', g.name) ORDER BY g.name) FILTER (WHERE g.id IS NOT NULL),
+        '[]'
+    ) AS genres,
+    subquery.modified
 FROM (
     SELECT
         fw.id,
         fw.title,
         fw.description,
         fw.rating,
-        ARRAY_AGG(p.id) as person_ids,
-        ARRAY_AGG(pfw.role) AS roles,
-        ARRAY_AGG(p.full_name) AS full_names
-    FROM content.film_work fw
+        fw.modified,
+        ARRAY_AGG(p.id ORDER BY pfw.role, p.full_name, p.id) as person_ids,
+        ARRAY_AGG(pfw.role ORDER BY pfw.role, p.full_name, p.id) AS roles,
+        ARRAY_AGG(p.full_name ORDER BY pfw.role, p.full_name, p.id) AS full_names
+    FROM ({}) AS fw
     LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
     LEFT JOIN content.person p ON p.id = pfw.person_id
-    WHERE {}
-    GROUP BY fw.id, fw.title, fw.description, fw.rating
+    GROUP BY fw.id, fw.title, fw.description, fw.rating, fw.modified
 ) AS subquery
 LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = subquery.id
 LEFT JOIN content.genre g ON g.id = gfw.genre_id
@@ -54,16 +107,123 @@ GROUP BY subquery.id,
          subquery.title,
          subquery.description,
          subquery.rating,
+         subquery.modified,
          subquery.person_ids,
          subquery.roles,
          subquery.full_names
-ORDER BY subquery.title
+ORDER BY subquery.modified, subquery.id
+'''
+
+EXTRUCT_JSON = '''SELECT
+    fw.id,
+    json_build_object(
+        'id', fw.id,
+        'imdb_rating', fw.rating,
+        'title', fw.title,
+        'description', fw.description,
+        'genres', COALESCE((
+            SELECT json_agg(json_build_object('id', g.id, 'name', g.name) ORDER BY g.name)
+            FROM content.genre_film_work gfw
+            JOIN content.genre g ON g.id = gfw.genre_id
+            WHERE gfw.film_work_id = fw.id
+        ), '[]'),
+        'directors_names', COALESCE(
+            json_agg(p.full_name ORDER BY p.full_name, p.id) FILTER (WHERE pfw.role = 'director' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'actors_names', COALESCE(
+            json_agg(p.full_name ORDER BY p.full_name, p.id) FILTER (WHERE pfw.role = 'actor' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'writers_names', COALESCE(
+            json_agg(p.full_name ORDER BY p.full_name, p.id) FILTER (WHERE pfw.role = 'writer' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'directors', COALESCE(
+            json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                FILTER (WHERE pfw.role = 'director' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'actors', COALESCE(
+            json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                FILTER (WHERE pfw.role = 'actor' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'writers', COALESCE(
+            json_agg(json_build_object('id', p.id, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                FILTER (WHERE pfw.role = 'writer' AND p.full_name IS NOT NULL),
+            '[]'
+        ),
+        'modified', fw.modified
+    )::text AS document,
+    fw.modified
+FROM ({}) AS fw
+LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+LEFT JOIN content.person p ON p.id = pfw.person_id
+GROUP BY fw.id, fw.title, fw.description, fw.rating, fw.modified
+ORDER BY fw.modified, fw.id
 '''
 
 RAW_GENRE_EXTRUCT = '''SELECT
     g.id,
     g.name,
-    g.description
+    g.description,
+    g.modified
+FROM content.genre g
+WHERE (g.modified, g.id) > (%s, %s) AND g.modified < %s
+    AND mod(hashtext(g.id::text) & 2147483647, %s) = %s
+ORDER BY g.modified, g.id
+LIMIT %s
+'''
+
+GENRES_BY_IDS = '''SELECT
+    g.id,
+    g.name,
+    g.description,
+    g.modified
 FROM content.genre g
-WHERE g.modified >= %s AND g.modified < %s
+WHERE g.id = ANY(%s::uuid[])
+'''
+
+PERSONS_BY_IDS = '''SELECT
+    p.id,
+    p.full_name,
+{}    p.modified
+FROM content.person p
+WHERE p.id = ANY(%s::uuid[])
+'''.format(PERSON_FILMS)
+
+BUCKET_CHECKSUMS = '''SELECT
+    left(t.id::text, %s) AS bucket,
+    count(*),
+    sum(floor(extract(epoch FROM t.modified)))::bigint
+FROM content.{} t
+WHERE t.id BETWEEN %s::uuid AND %s::uuid
+GROUP BY bucket
+'''
+
+BUCKET_ROWS = '''SELECT
+    t.id::text,
+    floor(extract(epoch FROM t.modified))::bigint
+FROM content.{} t
+WHERE t.id BETWEEN %s::uuid AND %s::uuid
+'''
+
+OUTBOX = '''SELECT
+    o.id,
+    o.entity,
+    o.entity_id,
+    o.xact_id::text::bigint
+FROM content.outbox o
+WHERE (o.xact_id, o.id) > (%s::text::xid8, %s)
+    AND o.xact_id < pg_snapshot_xmin(pg_current_snapshot())
+ORDER BY o.xact_id, o.id
+LIMIT %s
+'''
+
+# transaction id of a row read by a checkpoint that only stored the row id
+OUTBOX_XACT = '''SELECT xact_id::text::bigint FROM content.outbox WHERE id = %s'''
+
+OUTBOX_PRUNE = '''DELETE FROM content.outbox
+WHERE (xact_id, id) <= (%s::text::xid8, %s) AND created < now() - make_interval(hours => %s)
 '''
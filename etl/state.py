@@ -0,0 +1,29 @@
+import json
+
+import metrics
+
+
+class Batch(list):
+    # Rows of one extracted batch and the checkpoint to store once they are loaded
+    def __init__(self, rows=(), checkpoint=None):
+        super().__init__(rows)
+        self.checkpoint = checkpoint
+
+
+class State:
+    def __init__(self, redis_adapter, key='etl:checkpoints'):
+        self.redis_adapter = redis_adapter
+        self.key = key
+
+    def get(self, name: str) -> dict:
+        value = self.redis_adapter.hget(self.key, name)
+        if value is None:
+            # progress stored by the previous versions as a plain timestamp
+            legacy = self.redis_adapter.get(name)
+            return {'window': legacy} if legacy is not None else {}
+        return json.loads(value)
+
+    def set(self, name: str, value: dict):
+        # one field write, so a checkpoint is never stored partially
+        self.redis_adapter.hset(self.key, name, json.dumps(value, default=str))
+        metrics.checkpoint(name, value)
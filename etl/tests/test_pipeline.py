@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from pipeline import Pipeline, PipelineError
+from state import Batch
+
+
+class Stage:
+    # finishes every batch after its own delay, fails the batches listed in fail
+    def __init__(self, delays: dict, fail=()):
+        self.delays = delays
+        self.fail = fail
+
+    async def start(self, data):
+        seq = data[0]
+        await asyncio.sleep(self.delays.get(seq, 0))
+        if seq in self.fail:
+            raise ValueError(f'batch {seq}')
+
+
+async def batches(count: int, stored: list):
+    for seq in range(count):
+        yield Batch([seq], checkpoint=lambda seq=seq: stored.append(seq))
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_follow_extraction_order():
+    stored = []
+    pipeline = Pipeline('test', [(Stage({0: 0.05, 1: 0.02}), 3)])
+
+    await pipeline.run(batches(3, stored))
+
+    assert stored == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batches_before_failed_one_store_checkpoints():
+    stored = []
+    pipeline = Pipeline('test', [(Stage({0: 0.05}, fail=(1,)), 3)])
+
+    with pytest.raises(PipelineError):
+        await pipeline.run(batches(3, stored))
+
+    assert stored == [0]
+
+
+@pytest.mark.asyncio
+async def test_failed_pipeline_closes_source():
+    closed = []
+
+    async def source():
+        try:
+            for seq in range(100):
+                await asyncio.sleep(0.01)
+                yield Batch([seq])
+        finally:
+            closed.append(True)
+
+    pipeline = Pipeline('test', [(Stage({}, fail=(0,)), 1)])
+
+    with pytest.raises(PipelineError):
+        await pipeline.run(source())
+
+    assert closed == [True]
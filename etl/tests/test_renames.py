@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from es_loaders import Loader
+from main import etl_pipeline
+from state import Batch
+
+
+class Engine:
+    # keeps documents in memory, update by query applies the rename of persons as the script does
+    def __init__(self, documents: dict):
+        self.documents = documents
+
+    async def mget(self, index, ids, fields):
+        return {key: self.documents[index][key] for key in ids if key in self.documents[index]}
+
+    async def update_by_query(self, index, query, script):
+        names, updated = script['params']['names'], 0
+        for document in self.documents[index].values():
+            changed = False
+            for role in script['params']['roles']:
+                for i, person in enumerate(document.get(role, [])):
+                    if person['id'] in names and person['name'] != names[person['id']]:
+                        person['name'] = document[f'{role}_names'][i] = names[person['id']]
+                        changed = True
+            updated += changed
+        return updated
+
+    async def index(self, index, data, refresh=False):
+        self.documents[index].update({key: json.loads(value) for key, value in data.items()})
+        return []
+
+
+class Transformer:
+    async def start(self, data):
+        return {key: json.dumps({'id': key, 'name': name}) for key, name in data}
+
+
+async def batch(*rows):
+    yield Batch(rows)
+
+
+@pytest.mark.asyncio
+async def test_rename_and_film_change_in_one_cycle():
+    engine = Engine({
+        'persons': {'p1': {'id': 'p1', 'name': 'Old'}},
+        'movies': {'f1': {'id': 'f1', 'actors': [{'id': 'p1', 'name': 'Old'}], 'actors_names': ['Old']}},
+    })
+    loader = Loader(engine, 'persons')
+
+    # the person is reloaded for the changed film first, then by the rename itself
+    await etl_pipeline('persons_film_work', Transformer(), loader, renames=True).run(batch(('p1', 'New')))
+    await etl_pipeline('person', Transformer(), loader, renames=True).run(batch(('p1', 'New')))
+
+    assert engine.documents['persons']['p1']['name'] == 'New'
+    assert engine.documents['movies']['f1']['actors'] == [{'id': 'p1', 'name': 'New'}]
+    assert engine.documents['movies']['f1']['actors_names'] == ['New']
@@ -1,62 +1,108 @@
-class TransformerMovies:
-    FIELEDS = ['id', 'title', 'description', 'rating', 'person_ids', 'roles', 'full_names', 'genres']
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import orjson
+
+NAMES = {'actor': 'actors_names', 'director': 'directors_names', 'writer': 'writers_names'}
+PERSONS = {'actor': 'actors', 'director': 'directors', 'writer': 'writers'}
+
+_executor = None
+
+
+def movies_documents(rows):
+    # Rows are EXTRUCT tuples: id, title, description, rating, person_ids, roles, full_names, genres, modified;
+    # genres is the [{id, name}] list built by Postgres
+    documents = {}
+    for film_id, title, description, rating, person_ids, roles, full_names, genres, modified in rows:
+        film_id = str(film_id)
+        document = {
+            'id': film_id,
+            'imdb_rating': rating,
+            'title': title,
+            'description': description,
+            'genres': genres,
+            'directors_names': [],
+            'actors_names': [],
+            'writers_names': [],
+            'directors': [],
+            'actors': [],
+            'writers': [],
+            'modified': modified,
+        }
+        for person_id, person_role, person_name in zip(person_ids, roles, full_names):
+            if person_role is None or person_name is None:
+                continue
+            document[NAMES[person_role]].append(person_name)
+            document[PERSONS[person_role]].append({'id': str(person_id), 'name': person_name})
+        documents[film_id] = orjson.dumps(document)
+    return documents
+
+
+def persons_documents(rows):
+    # Rows are id, full_name, films, modified; films is the [{id, title, roles}] list built by Postgres
+    documents = {}
+    for person_id, name, films, modified in rows:
+        person_id = str(person_id)
+        documents[person_id] = orjson.dumps({'id': person_id, 'name': name, 'films': films, 'modified': modified})
+    return documents
+
+
+def genres_documents(rows):
+    documents = {}
+    for genre_id, name, description, modified in rows:
+        genre_id = str(genre_id)
+        documents[genre_id] = orjson.dumps(
+            {'id': genre_id, 'name': name, 'description': description, 'modified': modified},
+        )
+    return documents
 
-    async def start(self, data):
-        to_return = {}
-        for d_list in data:
-            d = {key: value for key, value in zip(self.FIELEDS, d_list)}
-            d['id'] = str(d['id'])
-            d['person_ids'] = [str(uuid) for uuid in d['person_ids']]
-
-            to_return[d['id']] = {
-                'id': d['id'],
-                'imdb_rating': d['rating'],
-                'title': d['title'],
-                'description': d['description'],
-                'genres': d['genres'],
-                'directors_names': [],
-                'actors_names': [],
-                'writers_names': [],
-                'directors': [],
-                'actors': [],
-                'writers': [],
-            }
-
-            for (person_id, person_role, person_name) in zip(d['person_ids'], d['roles'], d['full_names']):
-                if person_role is None or person_name is None:
-                    continue
-                to_return[d['id']][f'{person_role}s_names'].append(person_name)
-
-                to_return[d['id']][f'{person_role}s'].append({'id': person_id, 'name': person_name})
-
-        return to_return
-
-class TransformerPersons:
-    FIELDS = ['id', 'name']
+
+class Transformer:
+    # Builds documents straight from row tuples and serializes them with orjson. Batches of at least
+    # TRANSFORM_POOL_MIN_ROWS rows are split across TRANSFORM_PROCESSES worker processes.
+    FUNCTION = None
+
+    def __init__(self, processes=None, min_rows=None):
+        self.processes = int(processes if processes is not None else os.environ.get('TRANSFORM_PROCESSES', 0))
+        self.min_rows = int(min_rows or os.environ.get('TRANSFORM_POOL_MIN_ROWS', 5000))
+
+    def _executor(self):
+        global _executor
+        if _executor is None:
+            _executor = ProcessPoolExecutor(self.processes)
+        return _executor
 
     async def start(self, data):
-        res = {}
-        for item in data:
-            d = {key: value for key, value in zip(self.FIELDS, item)}
-            d['id'] = str(d['id'])
-            res[d['id']] = {
-                'id': d['id'],
-                'name': d['name'],
-            }
-        return res
-
-class TransformerGenres:
-    FIELEDS = ['id', 'name', 'description']
+        if not self.processes or len(data) < self.min_rows:
+            return type(self).FUNCTION(data)
+        loop = asyncio.get_running_loop()
+        size = -(-len(data) // self.processes)
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor(), type(self).FUNCTION, list(data[i:i + size]))
+                for i in range(0, len(data), size)
+            ),
+        )
+        documents = {}
+        for result in results:
+            documents.update(result)
+        return documents
+
+
+class TransformerMovies(Transformer):
+    FUNCTION = movies_documents
 
+
+class TransformerMoviesJson:
+    # Documents come from Postgres as JSON text and go to the bulk body as they are
     async def start(self, data):
-        to_return = {}
-        for d_list in data:
-            d = {key: value for key, value in zip(self.FIELEDS, d_list)}
-            d['id'] = str(d['id'])
-            to_return[d['id']] = {
-                'id': d['id'],
-                'name': d['name'],
-                'description': d['description'],
-            }
-
-        return to_return
+        return {str(row[0]): row[1] for row in data}
+
+
+class TransformerPersons(Transformer):
+    FUNCTION = persons_documents
+
+
+class TransformerGenres(Transformer):
+    FUNCTION = genres_documents
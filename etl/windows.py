@@ -0,0 +1,46 @@
+import datetime
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+
+MIN_FACTOR = 0.25
+MAX_FACTOR = 4.0
+
+_controllers = {}
+
+
+class WindowController:
+    # Sizes the next catch-up window from the rows and the time the previous one took, aiming at
+    # ETL_WINDOW_TARGET_ROWS rows and ETL_WINDOW_TARGET_SECONDS per window. Empty periods are skipped
+    # with growing windows, a burst of edits shrinks the window right away.
+    def __init__(self, name: str, initial: datetime.timedelta):
+        self.name = name
+        self.size = initial
+        self.target_rows = int(os.environ.get('ETL_WINDOW_TARGET_ROWS', 5000))
+        self.target_seconds = float(os.environ.get('ETL_WINDOW_TARGET_SECONDS', 30))
+        self.min_size = datetime.timedelta(seconds=int(os.environ.get('ETL_WINDOW_MIN_SECONDS', 60)))
+        self.max_size = datetime.timedelta(hours=int(os.environ.get('ETL_WINDOW_MAX_HOURS', 720)))
+
+    def next(self, remaining: datetime.timedelta) -> datetime.timedelta:
+        return min(self.size, remaining)
+
+    def observe(self, size: datetime.timedelta, rows: int, elapsed: float):
+        if rows == 0:
+            factor = MAX_FACTOR
+        else:
+            factor = min(self.target_rows / rows, self.target_seconds / max(elapsed, 0.001))
+        if size < self.size and factor >= 1:
+            # the window was cut at the current time, it says nothing about a bigger one
+            return
+        factor = max(MIN_FACTOR, min(MAX_FACTOR, factor))
+        self.size = max(self.min_size, min(self.max_size, size * factor))
+        if factor != 1:
+            logging.info(f'WINDOW {self.name}: {rows} rows in {elapsed:.1f} s, next window {self.size}')
+
+
+def window_controller(name: str) -> WindowController:
+    # Controllers live for the whole process, so every cycle starts from the size learned before
+    if name not in _controllers:
+        _controllers[name] = WindowController(name, datetime.timedelta(hours=int(os.environ.get('TIME_DELTA'))))
+    return _controllers[name]